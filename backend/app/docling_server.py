@@ -1,29 +1,117 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import importlib
 import json
 import logging
+import os
+import sys
 import tempfile
+import threading
+import time
 import traceback
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from importlib.metadata import PackageNotFoundError, version
 from pathlib import Path
+from typing import Any
 
+import pypdfium2
 from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from docling.datamodel.base_models import ConversionStatus, InputFormat
+from docling.datamodel.document import ConversionResult
 from docling.datamodel.pipeline_options import VlmConvertOptions, VlmPipelineOptions
 from docling.datamodel.vlm_engine_options import ApiVlmEngineOptions, VlmEngineType
 from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling.pipeline.vlm_pipeline import VlmPipeline
+from docling_core.types.doc import DoclingDocument
+
+from .metrics import (
+    DOCLING_CACHE_LOOKUPS,
+    DOCLING_CONVERSION_SECONDS,
+    DOCLING_PAGES,
+    DOCLING_PAGES_PER_SECOND,
+    VLM_REQUEST_SECONDS,
+    instrument,
+)
+from .parse_cache import CachedParse, ParseCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("docling-server")
 
 GRANITE_MODEL = "ibm-granite/granite-docling-258M"
+VLM_PRESET = "granite_docling"
 DEFAULT_VLLM_URL = "http://localhost:8000/v1/chat/completions"
+DEFAULT_TIMEOUT = 120
+
+# VLM API calls allowed in flight at once across every conversion in this process.
+DOCLING_VLM_CONCURRENCY = max(1, int(os.getenv("DOCLING_VLM_CONCURRENCY", "8")))
+# When > 0, PDFs longer than this many pages are split into ranges of this size
+# that convert concurrently (within the VLM budget) and are merged in page
+# order; /docling/parse/stream then also converts up to this many pages of a
+# document concurrently, submitting further windows as earlier ones finish.
+DOCLING_PAGE_RANGE_SIZE = max(0, int(os.getenv("DOCLING_PAGE_RANGE_SIZE", "0")))
+# Idle converters kept for reuse across requests, over all (vllm_url, timeout)
+# combinations; 0 builds a fresh converter for every request.
+DOCLING_CONVERTER_POOL_SIZE = int(
+    os.getenv("DOCLING_CONVERTER_POOL_SIZE", str(DOCLING_VLM_CONCURRENCY))
+)
+# Build and initialize a converter for the default VLM endpoint at startup so
+# the first request does not pay for it.
+DOCLING_WARMUP = os.getenv("DOCLING_WARMUP", "1").lower() not in {"0", "false", "no"}
+# Conversions run on their own bounded thread pool so they never block the event
+# loop; requests beyond DOCLING_WORKERS queue for a free worker.
+DOCLING_WORKERS = max(1, int(os.getenv("DOCLING_WORKERS", "2")))
+# Idle seconds between SSE comment lines sent while a streamed conversion runs,
+# so proxies and clients do not drop the connection.
+DOCLING_HEARTBEAT_SECONDS = float(os.getenv("DOCLING_HEARTBEAT_SECONDS", "15"))
+# Pages converted per step of /docling/parse/stream; each step's pages are sent
+# as soon as it finishes, so smaller windows mean an earlier first page.
+DOCLING_STREAM_PAGE_WINDOW = max(1, int(os.getenv("DOCLING_STREAM_PAGE_WINDOW", "1")))
+_ALL_PAGES = (1, sys.maxsize)
+# Parse results of previously seen PDFs, keyed by file content and the options
+# that shape the output; DOCLING_CACHE_MAX_BYTES=0 disables the cache.
+DOCLING_CACHE_DIR = Path(
+    os.getenv(
+        "DOCLING_CACHE_DIR", str(Path.home() / ".cache" / "chunkcanvas" / "docling")
+    )
+)
+DOCLING_CACHE_MAX_BYTES = int(os.getenv("DOCLING_CACHE_MAX_BYTES", str(2 * 1024**3)))
 
-app = FastAPI(title="ChunkCanvas Docling Server", version="0.3.0")
+_conversion_executor = ThreadPoolExecutor(
+    max_workers=DOCLING_WORKERS, thread_name_prefix="docling-convert"
+)
+# Page ranges of split documents; each range makes one VLM call at a time, so
+# this many threads can use the whole VLM budget.
+_range_executor = ThreadPoolExecutor(
+    max_workers=DOCLING_VLM_CONCURRENCY, thread_name_prefix="docling-range"
+)
+_vlm_slots = threading.BoundedSemaphore(DOCLING_VLM_CONCURRENCY)
+
+
+@asynccontextmanager
+async def _lifespan(_: FastAPI) -> AsyncIterator[None]:
+    if DOCLING_WARMUP and DOCLING_CONVERTER_POOL_SIZE > 0:
+        try:
+            await run_in_threadpool(
+                _converter_pool.warm_up, DEFAULT_VLLM_URL, DEFAULT_TIMEOUT
+            )
+        except Exception:
+            logger.warning("Converter warm-up failed: %s", traceback.format_exc())
+    yield
+    _conversion_executor.shutdown(wait=False, cancel_futures=True)
+    _range_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="ChunkCanvas Docling Server", version="0.3.0", lifespan=_lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -31,11 +119,66 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument(app, "docling")
+
+# Modules whose VLM engines import docling's API request helpers by name.
+_VLM_REQUEST_MODULES = (
+    "docling.models.inference_engines.vlm.api_openai_compatible_engine",
+    "docling.models.vlm_pipeline_models.api_vlm_model",
+)
+
+
+def _timed_vlm_request(request: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(request)
+    def timed(*args: Any, **kwargs: Any) -> Any:
+        with _vlm_slots:
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = request(*args, **kwargs)
+                outcome = "error" if getattr(result, "error", None) else "success"
+                return result
+            finally:
+                VLM_REQUEST_SECONDS.labels(outcome).observe(
+                    time.perf_counter() - started
+                )
+
+    timed.__vlm_timed__ = True  # type: ignore[attr-defined]
+    return timed
+
+
+def _instrument_vlm_requests() -> None:
+    """Time every VLM API call and hold one of the global VLM slots during it.
+
+    Docling has no hook around its HTTP calls, so the request helpers are
+    wrapped in the modules that use them. Missing modules are skipped.
+    """
+    for module_name in _VLM_REQUEST_MODULES:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        for name in ("api_image_request", "api_image_request_streaming"):
+            request = getattr(module, name, None)
+            if request is None or getattr(request, "__vlm_timed__", False):
+                continue
+            setattr(module, name, _timed_vlm_request(request))
+
+
+_instrument_vlm_requests()
+
+
+def _record_conversion(started: float, num_pages: int) -> None:
+    elapsed = time.perf_counter() - started
+    DOCLING_CONVERSION_SECONDS.observe(elapsed)
+    DOCLING_PAGES.inc(num_pages)
+    if num_pages and elapsed > 0:
+        DOCLING_PAGES_PER_SECOND.observe(num_pages / elapsed)
 
 
 def _build_converter(vllm_url: str, timeout: int) -> DocumentConverter:
     vlm_options = VlmConvertOptions.from_preset(
-        "granite_docling",
+        VLM_PRESET,
         engine_options=ApiVlmEngineOptions(
             runtime_type=VlmEngineType.API,
             url=vllm_url,
@@ -60,6 +203,210 @@ def _build_converter(vllm_url: str, timeout: int) -> DocumentConverter:
     )
 
 
+ConverterKey = tuple[str, int]
+
+
+class _ConverterPool:
+    """Reusable DocumentConverters keyed by the options they were built with.
+
+    Building a converter and initializing its VLM pipeline costs far more than
+    converting a small PDF, so converters go back to the pool after each
+    request. Each converter serves one conversion at a time; a checkout with
+    no idle converter for its key builds a new one. At most ``max_idle``
+    converters are kept, dropping those of the least recently used key first.
+    """
+
+    def __init__(self, max_idle: int) -> None:
+        self.max_idle = max_idle
+        self._idle: OrderedDict[ConverterKey, list[DocumentConverter]] = OrderedDict()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, vllm_url: str, timeout: int) -> Iterator[DocumentConverter]:
+        key = (vllm_url, timeout)
+        converter = self._take(key) or _build_converter(vllm_url, timeout)
+        try:
+            yield converter
+        finally:
+            self._give_back(key, converter)
+
+    def warm_up(self, vllm_url: str, timeout: int) -> None:
+        converter = _build_converter(vllm_url, timeout)
+        converter.initialize_pipeline(InputFormat.PDF)
+        self._give_back((vllm_url, timeout), converter)
+        logger.info("Converter for %s initialized", vllm_url)
+
+    def _take(self, key: ConverterKey) -> DocumentConverter | None:
+        with self._lock:
+            idle = self._idle.get(key)
+            if not idle:
+                return None
+            self._idle.move_to_end(key)
+            self._count -= 1
+            converter = idle.pop()
+            if not idle:
+                del self._idle[key]
+            return converter
+
+    def _give_back(self, key: ConverterKey, converter: DocumentConverter) -> None:
+        if self.max_idle <= 0:
+            return
+        with self._lock:
+            self._idle.setdefault(key, []).append(converter)
+            self._idle.move_to_end(key)
+            self._count += 1
+            while self._count > self.max_idle:
+                oldest_key, idle = next(iter(self._idle.items()))
+                idle.pop(0)
+                self._count -= 1
+                if not idle:
+                    del self._idle[oldest_key]
+
+
+_converter_pool = _ConverterPool(DOCLING_CONVERTER_POOL_SIZE)
+
+
+def _convert(
+    tmp_path: Path, vllm_url: str, timeout: int, page_range: tuple[int, int]
+) -> ConversionResult:
+    with _converter_pool.checkout(vllm_url, timeout) as converter:
+        return converter.convert(tmp_path, page_range=page_range)
+
+
+def _submit_conversion(
+    executor: ThreadPoolExecutor,
+    tmp_path: Path,
+    vllm_url: str,
+    timeout: int,
+    page_range: tuple[int, int] = _ALL_PAGES,
+) -> Future[ConversionResult]:
+    return executor.submit(_convert, tmp_path, vllm_url, timeout, page_range)
+
+
+def _page_ranges(total_pages: int, size: int) -> list[tuple[int, int]]:
+    return [
+        (first, min(first + size - 1, total_pages))
+        for first in range(1, total_pages + 1, size)
+    ]
+
+
+def _convert_ranges(
+    tmp_path: Path, vllm_url: str, timeout: int, total_pages: int
+) -> DoclingDocument:
+    """Convert the document's page ranges concurrently and merge them in order.
+
+    Returns or raises only once no range is still reading ``tmp_path``.
+    """
+    ranges = _page_ranges(total_pages, DOCLING_PAGE_RANGE_SIZE)
+    conversions = [
+        _submit_conversion(_range_executor, tmp_path, vllm_url, timeout, page_range)
+        for page_range in ranges
+    ]
+    try:
+        documents = []
+        for (first, last), conversion in zip(ranges, conversions):
+            result = conversion.result()
+            if result.status != ConversionStatus.SUCCESS:
+                raise RuntimeError(
+                    f"Conversion of pages {first}-{last} failed with status: {result.status}"
+                )
+            documents.append(result.document)
+    finally:
+        for conversion in conversions:
+            conversion.cancel()
+        wait(conversions)
+    return DoclingDocument.concatenate(documents)
+
+
+def _remove_when_done(path: Path, conversions: Sequence[Future[Any]]) -> None:
+    """Delete ``path`` once no conversion is reading it; queued ones are cancelled."""
+    for conversion in conversions:
+        conversion.cancel()
+    running = [conversion for conversion in conversions if not conversion.done()]
+    if not running:
+        path.unlink(missing_ok=True)
+        return
+
+    def remove(_: Future[Any]) -> None:
+        if all(conversion.done() for conversion in running):
+            path.unlink(missing_ok=True)
+
+    for conversion in running:
+        conversion.add_done_callback(remove)
+
+
+async def _heartbeats(conversion: asyncio.Future[Any]) -> AsyncIterator[str]:
+    """Yield SSE comment lines until ``conversion`` is done."""
+    while True:
+        done, _ = await asyncio.wait({conversion}, timeout=DOCLING_HEARTBEAT_SECONDS)
+        if done:
+            return
+        yield ": ping\n\n"
+
+
+_parse_cache = ParseCache(DOCLING_CACHE_DIR, DOCLING_CACHE_MAX_BYTES)
+
+
+def _docling_version() -> str:
+    try:
+        return version("docling")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+_DOCLING_VERSION = _docling_version()
+
+
+def _cache_lookup(content: bytes, vllm_url: str) -> tuple[str, CachedParse | None]:
+    key = ParseCache.key(
+        content,
+        {
+            "model": GRANITE_MODEL,
+            "preset": VLM_PRESET,
+            "vllm_url": vllm_url,
+            "docling": _DOCLING_VERSION,
+        },
+    )
+    cached = _parse_cache.get(key)
+    if _parse_cache.enabled:
+        DOCLING_CACHE_LOOKUPS.labels("miss" if cached is None else "hit").inc()
+    return key, cached
+
+
+def _cache_store(
+    key: str, document: DoclingDocument, markdown: str, pages: list[str] | None
+) -> None:
+    """Save a parse result; failures are logged since the result was already served."""
+    if not _parse_cache.enabled:
+        return
+    try:
+        if pages is None:
+            pages = [
+                document.export_to_markdown(page_no=page_no)
+                for page_no in range(1, document.num_pages() + 1)
+            ]
+        _parse_cache.put(key, CachedParse(markdown, pages, document.export_to_dict()))
+    except Exception:
+        logger.warning("Could not cache parse result: %s", traceback.format_exc())
+
+
+def _store_in_background(
+    key: str, document: DoclingDocument, markdown: str, pages: list[str] | None = None
+) -> None:
+    asyncio.get_running_loop().run_in_executor(
+        None, _cache_store, key, document, markdown, pages
+    )
+
+
+def _count_pages(pdf_path: Path) -> int:
+    pdf = pypdfium2.PdfDocument(pdf_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
 @app.get("/health")
 def health() -> dict[str, str]:
 
@@ -79,7 +426,7 @@ class ParseResponse(BaseModel):
 async def parse_document(
     file: UploadFile = File(...),
     vllm_url: str = Form(DEFAULT_VLLM_URL),
-    timeout: int = Form(120),
+    timeout: int = Form(DEFAULT_TIMEOUT),
 ) -> ParseResponse:
 
     ext = (file.filename or "document.pdf").rsplit(".", 1)[-1].lower()
@@ -88,30 +435,70 @@ async def parse_document(
 
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
 
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+    content = await file.read()
 
-        content = await file.read()
+    cache_key, cached = await run_in_threadpool(_cache_lookup, content, vllm_url)
+
+    if cached is not None:
+
+        return ParseResponse(
+            filename=file.filename or "document",
+            markdown=cached.markdown,
+            num_pages=cached.num_pages,
+        )
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
 
         tmp.write(content)
 
         tmp_path = Path(tmp.name)
 
+    conversions: list[Future[Any]] = []
+
     try:
 
-        converter = _build_converter(vllm_url=vllm_url, timeout=timeout)
+        total_pages = 0
+
+        if DOCLING_PAGE_RANGE_SIZE:
+
+            total_pages = await run_in_threadpool(_count_pages, tmp_path)
 
-        result = converter.convert(tmp_path)
+        started = time.perf_counter()
 
-        if result.status != ConversionStatus.SUCCESS:
+        if total_pages > DOCLING_PAGE_RANGE_SIZE:
 
-            raise HTTPException(
-                status_code=500,
-                detail=f"Conversion failed with status: {result.status}",
+            conversions.append(
+                _conversion_executor.submit(
+                    _convert_ranges, tmp_path, vllm_url, timeout, total_pages
+                )
+            )
+
+            document = await asyncio.wrap_future(conversions[0])
+
+        else:
+
+            conversions.append(
+                _submit_conversion(_conversion_executor, tmp_path, vllm_url, timeout)
             )
 
-        markdown = result.document.export_to_markdown()
+            result = await asyncio.wrap_future(conversions[0])
+
+            if result.status != ConversionStatus.SUCCESS:
+
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Conversion failed with status: {result.status}",
+                )
+
+            document = result.document
+
+        num_pages = document.num_pages()
+
+        _record_conversion(started, num_pages)
 
-        num_pages = len(result.pages)
+        markdown = await run_in_threadpool(document.export_to_markdown)
+
+        _store_in_background(cache_key, document, markdown)
 
         return ParseResponse(
             filename=file.filename or "document",
@@ -131,14 +518,16 @@ async def parse_document(
 
     finally:
 
-        tmp_path.unlink(missing_ok=True)
+        # The conversion keeps running if the client went away; the file is
+        # removed once it stops reading it.
+        _remove_when_done(tmp_path, conversions)
 
 
 @app.post("/docling/parse/stream")
 async def parse_document_stream(
     file: UploadFile = File(...),
     vllm_url: str = Form(DEFAULT_VLLM_URL),
-    timeout: int = Form(120),
+    timeout: int = Form(DEFAULT_TIMEOUT),
 ) -> StreamingResponse:
 
     ext = (file.filename or "document.pdf").rsplit(".", 1)[-1].lower()
@@ -149,10 +538,40 @@ async def parse_document_stream(
 
     file_content = await file.read()
 
+    cache_key, cached = await run_in_threadpool(_cache_lookup, file_content, vllm_url)
+
     def _sse_event(event: str, data: dict) -> str:
 
         return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
+    async def replay_cached(cached: CachedParse):
+
+        yield _sse_event(
+            "progress",
+            {"status": "cached", "page": 0, "total_pages": cached.num_pages},
+        )
+
+        for page_no, page_md in enumerate(cached.pages, start=1):
+
+            yield _sse_event(
+                "progress",
+                {
+                    "status": "processing",
+                    "page": page_no,
+                    "total_pages": cached.num_pages,
+                },
+            )
+
+            yield _sse_event("page_result", {"page": page_no, "markdown": page_md})
+
+        yield _sse_event(
+            "complete",
+            {
+                "markdown": cached.markdown,
+                "num_pages": cached.num_pages,
+            },
+        )
+
     async def event_generator():
 
         with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
@@ -161,48 +580,95 @@ async def parse_document_stream(
 
             tmp_path = Path(tmp.name)
 
+        conversions: list[Future[ConversionResult]] = []
+
         try:
 
-            converter = _build_converter(vllm_url=vllm_url, timeout=timeout)
+            total_pages = await run_in_threadpool(_count_pages, tmp_path)
 
             yield _sse_event(
-                "progress", {"status": "converting", "page": 0, "total_pages": 0}
+                "progress",
+                {"status": "converting", "page": 0, "total_pages": total_pages},
             )
 
-            result = converter.convert(tmp_path)
+            started = time.perf_counter()
 
-            if result.status != ConversionStatus.SUCCESS:
+            documents: list[DoclingDocument] = []
 
-                yield _sse_event(
-                    "error", {"message": f"Conversion failed: {result.status}"}
-                )
+            page_markdowns: list[str] = []
+
+            windows = _page_ranges(total_pages, DOCLING_STREAM_PAGE_WINDOW)
+
+            executor = _conversion_executor
+
+            ahead = 1
+
+            if DOCLING_PAGE_RANGE_SIZE:
+
+                # Windows convert concurrently but are still sent in page order.
+                # Only one range worth of pages is queued at a time, so a long
+                # document cannot fill the shared pool ahead of other requests.
+                executor = _range_executor
+
+                ahead = max(1, DOCLING_PAGE_RANGE_SIZE // DOCLING_STREAM_PAGE_WINDOW)
+
+            # Send each page as soon as its window is done, instead of waiting
+            # for the whole document.
+            for index, (first, last) in enumerate(windows):
+
+                while len(conversions) < min(index + ahead, len(windows)):
+
+                    conversions.append(
+                        _submit_conversion(
+                            executor,
+                            tmp_path,
+                            vllm_url,
+                            timeout,
+                            windows[len(conversions)],
+                        )
+                    )
 
-                return
+                waiter = asyncio.wrap_future(conversions[index])
 
-            doc = result.document
+                async for ping in _heartbeats(waiter):
 
-            num_pages = len(result.pages)
+                    yield ping
 
-            if hasattr(doc, "pages") and doc.pages:
+                result = await waiter
 
-                pages = list(doc.pages.values())
+                if result.status != ConversionStatus.SUCCESS:
 
-                for i in range(len(pages)):
+                    yield _sse_event(
+                        "error",
+                        {
+                            "message": f"Conversion of pages {first}-{last} failed: {result.status}"
+                        },
+                    )
 
-                    page_no = i + 1
+                    return
+
+                doc = result.document
+
+                documents.append(doc)
+
+                for page_no in range(first, last + 1):
 
                     yield _sse_event(
                         "progress",
                         {
                             "status": "processing",
                             "page": page_no,
-                            "total_pages": num_pages,
+                            "total_pages": total_pages,
                         },
                     )
 
+                    page_md = ""
+
                     try:
 
-                        page_md = doc.export_to_markdown(page_no=page_no)
+                        page_md = await run_in_threadpool(
+                            doc.export_to_markdown, page_no=page_no
+                        )
 
                         yield _sse_event(
                             "page_result",
@@ -216,13 +682,27 @@ async def parse_document_stream(
 
                         logger.debug("Could not export page %d individually", page_no)
 
-            markdown = doc.export_to_markdown()
+                    page_markdowns.append(page_md)
+
+            _record_conversion(started, total_pages)
+
+            if len(documents) == 1:
+
+                doc = documents[0]
+
+            else:
+
+                doc = await run_in_threadpool(DoclingDocument.concatenate, documents)
+
+            markdown = await run_in_threadpool(doc.export_to_markdown)
+
+            _store_in_background(cache_key, doc, markdown, page_markdowns)
 
             yield _sse_event(
                 "complete",
                 {
                     "markdown": markdown,
-                    "num_pages": num_pages,
+                    "num_pages": total_pages,
                 },
             )
 
@@ -234,10 +714,11 @@ async def parse_document_stream(
 
         finally:
 
-            tmp_path.unlink(missing_ok=True)
+            # Queued windows are cancelled; running ones still read the file.
+            _remove_when_done(tmp_path, conversions)
 
     return StreamingResponse(
-        event_generator(),
+        event_generator() if cached is None else replay_cached(cached),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
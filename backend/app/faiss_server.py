@@ -1,17 +1,100 @@
 from __future__ import annotations
 
-import json
+import io
+import logging
+import math
+import os
 import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable, Hashable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Literal
 
 import faiss
 import numpy as np
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, field_validator, model_validator
+from pydantic import (
+    BaseModel,
+    Field,
+    ValidationError,
+    field_validator,
+    model_validator,
+)
+
+from .index_log import IndexLog, LogOp
+from .metrics import (
+    INDEX_CACHE_LOOKUPS,
+    INDEX_LOAD_SECONDS,
+    INDEX_READ_BYTES,
+    INDEX_SAVE_SECONDS,
+    INDEX_WRITTEN_BYTES,
+    UPSERT_VECTORS,
+    instrument,
+)
+from .record_store import (
+    MetadataFilter,
+    RecordRow,
+    RecordStore,
+    migrate_meta_json,
+    validate_filter,
+)
 
 MetricName = Literal["cosine", "l2", "ip"]
+IndexType = Literal["flat", "ivf_flat", "ivf_pq", "hnsw"]
+VectorStorage = Literal["float32", "fp16", "sq8", "pq"]
+# As reported for existing indexes; "factory" marks a lossy factory codec that
+# none of the VectorStorage names describe.
+IndexStorage = Literal["float32", "fp16", "sq8", "pq", "factory"]
+PersistMode = Literal["sync", "wal", "deferred"]
+SearchMode = Literal["vector", "lexical", "hybrid"]
+ScoreNormalization = Literal["minmax", "rank"]
+
+logger = logging.getLogger("faiss-server")
+
+# Upper bound for the loaded-index cache, measured as on-disk index + log size.
+FAISS_CACHE_MAX_BYTES = int(os.getenv("FAISS_CACHE_MAX_BYTES", str(2 * 1024**3)))
+# "sync" rewrites the .faiss file on every upsert; "wal" appends to a per-index
+# log and only rewrites the index once the log grows past the checkpoint size;
+# "deferred" applies mutations in memory and a background writer rewrites the
+# index at most every FAISS_FLUSH_INTERVAL_MS, or sooner once
+# FAISS_FLUSH_MAX_MUTATIONS upserts/deletes are pending. Deferred mode trades
+# durability for throughput: a crash loses unflushed vectors, and it assumes a
+# single server process owns each index.
+_persist_mode = os.getenv("FAISS_PERSIST_MODE", "sync").lower()
+FAISS_PERSIST_MODE: PersistMode = (
+    _persist_mode if _persist_mode in {"wal", "deferred"} else "sync"
+)
+FAISS_FLUSH_INTERVAL_MS = float(os.getenv("FAISS_FLUSH_INTERVAL_MS", "1000"))
+FAISS_FLUSH_MAX_MUTATIONS = int(os.getenv("FAISS_FLUSH_MAX_MUTATIONS", "100"))
+FAISS_WAL_CHECKPOINT_BYTES = int(
+    os.getenv("FAISS_WAL_CHECKPOINT_BYTES", str(256 * 1024**2))
+)
+# Memory-map indexes opened for reads so workers share page-cache pages and
+# opening costs the same regardless of index size.
+FAISS_MMAP_READS = os.getenv("FAISS_MMAP_READS", "1").lower() not in {
+    "0",
+    "false",
+    "no",
+}
+# Threads fanning a search out over the shards of a sharded index; faiss
+# releases the GIL while searching, so shards are scanned in parallel.
+FAISS_SHARD_SEARCH_THREADS = int(
+    os.getenv("FAISS_SHARD_SEARCH_THREADS", str(os.cpu_count() or 4))
+)
+_MAX_SHARDS = 64
+# Concurrent unfiltered searches of one index are coalesced into a single faiss
+# call of up to FAISS_SEARCH_BATCH_MAX query rows; the first query of a batch
+# waits at most FAISS_SEARCH_BATCH_WAIT_MS for others. A max of 1 disables it.
+FAISS_SEARCH_BATCH_MAX = int(os.getenv("FAISS_SEARCH_BATCH_MAX", "64"))
+FAISS_SEARCH_BATCH_WAIT_MS = float(os.getenv("FAISS_SEARCH_BATCH_WAIT_MS", "2"))
 
 
 class CreateIndexRequest(BaseModel):
@@ -21,6 +104,30 @@ class CreateIndexRequest(BaseModel):
     dimension: int = Field(..., gt=0)
     metric: MetricName = "cosine"
     overwrite: bool = False
+    index_type: IndexType = "flat"
+    # How vectors are encoded inside the index; ivf_pq always uses PQ codes.
+    storage: VectorStorage = "float32"
+    # Keep full-precision vectors in the record store for exact re-ranking.
+    # Defaults to on whenever the index encoding is lossy.
+    store_vectors: bool | None = None
+    # Raw faiss.index_factory description, e.g. "OPQ16,IVF4096,PQ16"; overrides index_type.
+    factory: str | None = None
+    nlist: int = Field(1024, gt=0)
+    nprobe: int = Field(16, gt=0)
+    pq_m: int = Field(16, gt=0)
+    pq_nbits: int = Field(8, ge=1, le=16)
+    hnsw_m: int = Field(32, ge=4)
+    ef_construction: int = Field(200, gt=0)
+    ef_search: int = Field(64, gt=0)
+    # Number of .faiss files the vectors are spread over, routed by id hash.
+    shards: int = Field(1, ge=1, le=_MAX_SHARDS)
+
+    @model_validator(mode="after")
+    def validate_index_type(self) -> "CreateIndexRequest":
+        uses_pq = self.index_type == "ivf_pq" or self.storage == "pq"
+        if self.factory is None and uses_pq and self.dimension % self.pq_m != 0:
+            raise ValueError("dimension must be a multiple of pq_m")
+        return self
 
     @model_validator(mode="after")
     def validate_location(self) -> "CreateIndexRequest":
@@ -56,6 +163,158 @@ class UpsertRequest(BaseModel):
         return items
 
 
+class BinaryUpsertRecords(BaseModel):
+    """Column-oriented records sent next to a packed vector buffer."""
+
+    ids: list[int] = Field(..., min_length=1)
+    texts: list[str] | None = None
+    metadata: list[dict[str, Any]] | None = None
+
+    @model_validator(mode="after")
+    def validate_columns(self) -> "BinaryUpsertRecords":
+        if len(set(self.ids)) != len(self.ids):
+            raise ValueError("Duplicate ids in request")
+        for name in ("texts", "metadata"):
+            column = getattr(self, name)
+            if column is not None and len(column) != len(self.ids):
+                raise ValueError(f"{name} must have one entry per id")
+        return self
+
+    def rows(self) -> list[RecordRow]:
+        texts = self.texts or [""] * len(self.ids)
+        metadata = self.metadata or [{} for _ in self.ids]
+        return list(zip(self.ids, texts, metadata))
+
+
+class IngestProgress(BaseModel):
+    ingest_id: str
+    db_path: str
+    status: Literal["running", "done", "failed"] = "running"
+    lines: int = 0
+    upserted: int = 0
+    batches: int = 0
+    total: int | None = None
+    error: str | None = None
+
+
+class SearchQuery(BaseModel):
+    """Query fields shared by single-index and federated search."""
+
+    # "lexical" ranks record texts by BM25; "hybrid" fuses that ranking with the
+    # vector one, pairing vectors[i] with queries[i].
+    mode: SearchMode = "vector"
+    vectors: list[list[float]] = Field(default_factory=list)
+    queries: list[str] = Field(default_factory=list)
+    k: int = Field(10, ge=1, le=1000)
+    # Per-query overrides for IVF and HNSW indexes; ignored by other index types.
+    nprobe: int | None = Field(None, gt=0)
+    ef_search: int | None = Field(None, gt=0)
+    # Re-score the top k * rerank_factor candidates against full-precision vectors.
+    rerank: bool = False
+    rerank_factor: int = Field(4, ge=1, le=100)
+    # Metadata conditions, ANDed across keys: {"filename": "a.pdf"},
+    # {"page": {"gte": 2, "lt": 10}}, {"sheet": {"in": ["Q1", "Q2"]}}.
+    filter: MetadataFilter | None = None
+    # Reciprocal rank fusion constant; larger values flatten the rank weighting.
+    rrf_k: int = Field(60, ge=1)
+
+    @model_validator(mode="after")
+    def validate_inputs(self) -> "SearchQuery":
+        if self.mode != "lexical" and not self.vectors:
+            raise ValueError(f"vectors are required for {self.mode} search")
+        if self.mode != "vector" and not self.queries:
+            raise ValueError(f"queries are required for {self.mode} search")
+        if self.mode == "hybrid" and len(self.queries) != len(self.vectors):
+            raise ValueError("hybrid search needs one query per vector")
+        return self
+
+    @field_validator("filter")
+    @classmethod
+    def validate_metadata_filter(
+        cls, conditions: MetadataFilter | None
+    ) -> MetadataFilter | None:
+        if conditions is None:
+            return None
+        if not conditions:
+            raise ValueError("filter needs at least one condition")
+        return validate_filter(conditions)
+
+
+class SearchRequest(SearchQuery):
+    db_path: str = Field(..., min_length=1)
+
+
+class FederatedSearchRequest(SearchQuery):
+    # Target indexes: an explicit list, or every index under base_dir matching pattern.
+    db_paths: list[str] | None = Field(None, min_length=1)
+    base_dir: str | None = None
+    pattern: str = "**/*.faiss"
+    # How scores from different indexes are made comparable before merging:
+    # "minmax" scales each metric's scores per query to [0, 1]; "rank" scores
+    # every hit 1 / (rrf_k + its rank within its own index).
+    normalization: ScoreNormalization = "minmax"
+
+    @model_validator(mode="after")
+    def validate_targets(self) -> "FederatedSearchRequest":
+        if (self.db_paths is None) == (
+            self.base_dir is None or not self.base_dir.strip()
+        ):
+            raise ValueError("Provide either db_paths or base_dir")
+        return self
+
+
+class DeleteRequest(BaseModel):
+    db_path: str = Field(..., min_length=1)
+    ids: list[int] | None = Field(None, min_length=1)
+    # Same syntax as SearchRequest.filter, e.g. {"filename": "a.pdf"}.
+    filter: MetadataFilter | None = None
+
+    @model_validator(mode="after")
+    def validate_target(self) -> "DeleteRequest":
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Provide either ids or filter")
+        if self.filter is not None:
+            if not self.filter:
+                raise ValueError("filter needs at least one condition")
+            validate_filter(self.filter)
+        return self
+
+
+class DeleteResponse(BaseModel):
+    db_path: str
+    deleted: int
+    total: int
+    # Deleted ids whose vectors are still waiting for background compaction.
+    pending_compaction: int
+
+
+class SearchHit(BaseModel):
+    id: int
+    score: float
+    text: str
+    metadata: dict[str, Any]
+
+
+class SearchResponse(BaseModel):
+    db_path: str
+    metric: MetricName
+    dimension: int
+    results: list[list[SearchHit]]
+
+
+class FederatedHit(SearchHit):
+    db_path: str
+    # Score as returned by the source index, before normalization.
+    raw_score: float
+
+
+class FederatedSearchResponse(BaseModel):
+    indexes: list[str]
+    # Targets that could not be searched (e.g. wrong dimension), with the reason.
+    skipped: dict[str, str] = Field(default_factory=dict)
+    results: list[list[FederatedHit]]
+
+
 class RecordView(BaseModel):
     id: int
     text: str
@@ -69,6 +328,8 @@ class ContentResponse(BaseModel):
     metric: MetricName
     dimension: int
     items: list[RecordView]
+    # Pass as after_id to fetch the following page without an offset scan.
+    next_after_id: int | None = None
 
 
 class InfoResponse(BaseModel):
@@ -76,6 +337,12 @@ class InfoResponse(BaseModel):
     total: int
     metric: MetricName
     dimension: int
+    index_type: str = "flat"
+    storage: IndexStorage = "float32"
+    is_trained: bool = True
+    # Deleted vectors not yet compacted out of the index; excluded from total.
+    tombstones: int = 0
+    shards: int = 1
 
 
 class IndexEntry(BaseModel):
@@ -88,7 +355,14 @@ class ListIndexesResponse(BaseModel):
     indexes: list[IndexEntry]
 
 
-app = FastAPI(title="ChunkCanvas FAISS API", version="0.1.0")
+@asynccontextmanager
+async def _lifespan(_: FastAPI) -> AsyncIterator[None]:
+    yield
+    # Graceful shutdown: write out every index the deferred writer still holds.
+    await run_in_threadpool(_flusher.close)
+
+
+app = FastAPI(title="ChunkCanvas FAISS API", version="0.1.0", lifespan=_lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -96,6 +370,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument(app, "faiss")
 
 
 def _normalize_db_path(db_path: str) -> Path:
@@ -129,56 +404,1097 @@ def _meta_path(db_file: Path) -> Path:
     return db_file.with_suffix(".meta.json")
 
 
+# Extra shard files of a sharded index: <name>.shard-<n>.faiss
+_SHARD_STEM = re.compile(r"\.shard-\d+$")
+
+
+def _shard_path(db_file: Path, shard: int) -> Path:
+    """File of one shard; shard 0 is the index's own file, so unsharded indexes are unchanged."""
+    if shard == 0:
+        return db_file
+    return db_file.with_name(f"{db_file.stem}.shard-{shard}{db_file.suffix}")
+
+
+def _shard_of(ids: np.ndarray, shard_count: int) -> np.ndarray:
+    """Shard number for each id, from a multiplicative hash so id runs spread evenly."""
+    if shard_count == 1:
+        return np.zeros(len(ids), dtype=np.intp)
+    mixed = np.ascontiguousarray(ids, dtype=np.int64).view(np.uint64)
+    mixed = mixed * np.uint64(0x9E3779B97F4A7C15)
+    return ((mixed >> np.uint64(32)) % np.uint64(shard_count)).astype(np.intp)
+
+
+def _split_by_shard(
+    ids: np.ndarray, shard_count: int
+) -> Iterator[tuple[int, np.ndarray]]:
+    """(shard, positions into ids) for every shard that receives at least one id."""
+    owners = _shard_of(ids, shard_count)
+    for shard in range(shard_count):
+        positions = np.flatnonzero(owners == shard)
+        if positions.size:
+            yield shard, positions
+
+
 def _metric_type(metric: MetricName) -> int:
     if metric == "l2":
         return faiss.METRIC_L2
     return faiss.METRIC_INNER_PRODUCT
 
 
-def _new_index(dimension: int, metric: MetricName) -> faiss.IndexIDMap2:
+def _index_description(payload: CreateIndexRequest) -> str | None:
+    """faiss.index_factory string for the requested index, or None for plain flat."""
+    if payload.factory and payload.factory.strip():
+        return payload.factory.strip()
+
+    pq_codec = f"PQ{payload.pq_m}x{payload.pq_nbits}"
+    codec = {
+        "float32": "Flat",
+        "fp16": "SQfp16",
+        "sq8": "SQ8",
+        "pq": pq_codec,
+    }[payload.storage]
+
+    if payload.index_type == "ivf_flat":
+        return f"IVF{payload.nlist},{codec}"
+    if payload.index_type == "ivf_pq":
+        return f"IVF{payload.nlist},{pq_codec}"
+    if payload.index_type == "hnsw":
+        if payload.storage == "float32":
+            return f"HNSW{payload.hnsw_m}"
+        return f"HNSW{payload.hnsw_m},{codec}"
+    if payload.storage == "float32":
+        return None
+    return codec
+
+
+_FACTORY_CODECS: dict[str, VectorStorage] = {"SQfp16": "fp16", "SQ8": "sq8"}
+# Factory components that neither encode vectors lossily nor change what is stored.
+_FACTORY_STRUCTURE = re.compile(
+    r"(IVF|IMI|HNSW|NSG)\d+(x\d+)?|IDMap2?|Flat|L2norm|OPQ\d+|RR\d+|\d+"
+)
+
+
+def _factory_storage(description: str) -> IndexStorage:
+    """Storage label of a factory description, e.g. "pq" for "IVF16,PQ4x4"."""
+    found: set[IndexStorage] = set()
+    for part in re.split(r"[,_]", description):
+        if part in _FACTORY_CODECS:
+            found.add(_FACTORY_CODECS[part])
+        elif re.fullmatch(r"PQ\d+(x\d+)?(fs|np)?", part):
+            found.add("pq")
+        elif not _FACTORY_STRUCTURE.fullmatch(part):
+            return "factory"
+    if len(found) > 1:
+        return "factory"
+    return found.pop() if found else "float32"
+
+
+def _is_lossy(payload: CreateIndexRequest) -> bool:
+    if payload.factory is not None:
+        return any(codec in payload.factory for codec in ("PQ", "SQ", "LSH", "RaBitQ"))
+    return payload.index_type == "ivf_pq" or payload.storage != "float32"
+
+
+def _new_index(
+    dimension: int, metric: MetricName, description: str | None = None
+) -> faiss.Index:
     metric_type = _metric_type(metric)
-    base = faiss.IndexFlat(dimension, metric_type)
-    return faiss.IndexIDMap2(base)
+    if description is None:
+        base = faiss.IndexFlat(dimension, metric_type)
+        return faiss.IndexIDMap2(base)
+    return _prepare_index(faiss.index_factory(dimension, description, metric_type))
+
+
+def _prepare_index(index: faiss.Index) -> faiss.Index:
+    """Make an index addressable by external ids.
+
+    IVF indexes store ids natively and get a hashtable direct map so vectors can
+    be reconstructed and removed by id; everything else is wrapped in IndexIDMap2.
+    """
+    if isinstance(index, faiss.IndexIDMap2):
+        return index
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        if ivf.direct_map.type != faiss.DirectMap.Hashtable:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def _supports_remove(index: faiss.Index) -> bool:
+    base = index.index if isinstance(index, faiss.IndexIDMap2) else index
+    return not isinstance(faiss.downcast_index(base), faiss.IndexHNSW)
+
+
+def _configure_search_defaults(index: faiss.Index, payload: CreateIndexRequest) -> None:
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(payload.nprobe, ivf.nlist)
+    hnsw = _hnsw_index(index)
+    if hnsw is not None:
+        hnsw.hnsw.efConstruction = payload.ef_construction
+        hnsw.hnsw.efSearch = payload.ef_search
+
+
+def _hnsw_index(index: faiss.Index) -> faiss.IndexHNSW | None:
+    base = index.index if isinstance(index, faiss.IndexIDMap2) else index
+    base = faiss.downcast_index(base)
+    return base if isinstance(base, faiss.IndexHNSW) else None
+
+
+def _accepts_selector(index: faiss.Index) -> bool:
+    """Whether searches of ``index`` honour an ID selector.
+
+    IVF, HNSW, flat and scalar-quantizer indexes do. IndexPQ and LSH reject any
+    search parameters, and other factory layouts are not assumed to work.
+    """
+    if faiss.try_extract_index_ivf(index) is not None:
+        return True
+    if _hnsw_index(index) is not None:
+        return True
+    base = index.index if isinstance(index, faiss.IndexIDMap2) else index
+    base = faiss.downcast_index(base)
+    while isinstance(base, faiss.IndexPreTransform):
+        base = faiss.downcast_index(base.index)
+    return isinstance(base, (faiss.IndexFlat, faiss.IndexScalarQuantizer))
+
+
+def _search_params(
+    index: faiss.Index,
+    nprobe: int | None,
+    ef_search: int | None,
+    selector: faiss.IDSelector | None = None,
+) -> faiss.SearchParameters | None:
+    """Per-call search parameters; ``selector`` restricts the scan to matching ids.
+
+    The caller must keep ``selector`` alive for as long as the parameters are used.
+    """
+    # IVF and HNSW reject the base parameter type, so a selector on its own still
+    # needs the typed parameters, seeded from the index's configured defaults.
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and (nprobe is not None or selector is not None):
+        return faiss.SearchParametersIVF(nprobe=nprobe or ivf.nprobe, sel=selector)
+    hnsw = _hnsw_index(index)
+    if hnsw is not None and (ef_search is not None or selector is not None):
+        return faiss.SearchParametersHNSW(
+            efSearch=ef_search or hnsw.hnsw.efSearch, sel=selector
+        )
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def _wal_path(db_file: Path) -> Path:
+    return db_file.with_name(db_file.name + ".wal")
 
 
-def _load_meta(db_file: Path) -> dict[str, Any]:
-    path = _meta_path(db_file)
-    if not path.exists():
-        return {"records": {}, "dimension": None, "metric": "cosine"}
+def _records_path(db_file: Path) -> Path:
+    return db_file.with_suffix(".records.sqlite")
+
+
+def _open_records(db_file: Path) -> RecordStore:
     try:
-        data = json.loads(path.read_text(encoding="utf-8"))
-        if not isinstance(data, dict):
-            raise ValueError("invalid meta format")
-        if "records" not in data or not isinstance(data["records"], dict):
-            data["records"] = {}
-        return data
+        store = RecordStore(_records_path(db_file))
+        legacy_meta = _meta_path(db_file)
+        if legacy_meta.exists():
+            migrate_meta_json(legacy_meta, store)
+        return store
     except Exception as exc:
         raise HTTPException(
             status_code=500, detail=f"Failed to read metadata: {exc}"
         ) from exc
 
 
-def _save_meta(db_file: Path, payload: dict[str, Any]) -> None:
-    meta_file = _meta_path(db_file)
-    meta_file.parent.mkdir(parents=True, exist_ok=True)
-    meta_file.write_text(
-        json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
+def _ensure_trained(db_file: Path, entry: _CachedIndex, vectors: np.ndarray) -> None:
+    """Train an empty IVF/PQ index on its first upsert batch.
+
+    The trained (still empty) index is written out right away, so log entries
+    appended afterwards can always be replayed on top of the file. Shards are
+    trained once and share the same quantizer.
+    """
+    if entry.is_trained:
+        return
+    trained = entry.shards[0]
+    try:
+        trained.train(vectors)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to train index on the first batch ({len(vectors)} vectors): {exc}",
+        ) from exc
+    entry.shards = [trained] + [
+        _prepare_index(faiss.clone_index(trained)) for _ in entry.shards[1:]
+    ]
+    _checkpoint(db_file, entry)
+
 
+def _stored_metric(store: RecordStore) -> MetricName:
+    metric = store.get_setting("metric", "cosine")
+    if metric not in {"cosine", "l2", "ip"}:
+        metric = "cosine"
+    return metric
 
-def _read_index(db_file: Path) -> faiss.IndexIDMap2:
+
+def _mmap_flags(index_type: str) -> int:
+    # IVF data lives in inverted lists, everything else in flat code arrays;
+    # faiss maps the two with different flags and they cannot be combined.
+    if "ivf" in index_type.lower():
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    flat_codes = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    return flat_codes | faiss.IO_FLAG_READ_ONLY if flat_codes else 0
+
+
+def _read_index(db_file: Path, io_flags: int = 0) -> faiss.Index:
     try:
-        loaded = faiss.read_index(str(db_file))
+        loaded = faiss.read_index(str(db_file), io_flags)
     except Exception as exc:
         raise HTTPException(
             status_code=500, detail=f"Failed to load FAISS index: {exc}"
         ) from exc
 
-    if isinstance(loaded, faiss.IndexIDMap2):
-        return loaded
+    return _prepare_index(loaded)
+
+
+def _write_index(index: faiss.Index, db_file: Path) -> None:
+    tmp_file = db_file.with_name(db_file.name + ".tmp")
+    try:
+        with INDEX_SAVE_SECONDS.time():
+            faiss.write_index(index, str(tmp_file))
+        INDEX_WRITTEN_BYTES.labels("index").inc(tmp_file.stat().st_size)
+        os.replace(tmp_file, db_file)
+    except Exception as exc:
+        tmp_file.unlink(missing_ok=True)
+        raise HTTPException(
+            status_code=500, detail=f"Failed to save index: {exc}"
+        ) from exc
+
+
+def _apply_upsert(
+    index: faiss.Index, ids: np.ndarray, vectors: np.ndarray
+) -> faiss.Index:
+    """Replace ``ids`` in ``index`` and return the index to keep using.
+
+    Indexes without removal (HNSW) are rebuilt without the ids they already
+    hold, so the result may be a new object; either way replaying an upsert
+    twice leaves one copy of each vector.
+    """
+    if _supports_remove(index):
+        _apply_remove(index, ids)
+    elif np.isin(ids, faiss.vector_to_array(index.id_map)).any():
+        index = _rebuild_without(index, ids)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def _apply_remove(index: faiss.Index, ids: np.ndarray) -> None:
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    selector = faiss.IDSelectorArray(ids.size, faiss.swig_ptr(ids))
+    index.remove_ids(selector)
+
+
+def _stored_ids(index: faiss.Index) -> np.ndarray | None:
+    """Ids of the vectors in ``index``, or None for layouts that do not expose them."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return None
+    invlists = ivf.invlists
+    lists = [np.empty(0, dtype=np.int64)]
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if not size:
+            continue
+        ids = invlists.get_ids(list_no)
+        lists.append(faiss.rev_swig_ptr(ids, size).copy())
+        invlists.release_ids(list_no, ids)
+    return np.concatenate(lists)
+
+
+def _drop_orphan_records(
+    db_file: Path, records: RecordStore, shards: list[faiss.Index], tombstones: int
+) -> None:
+    """Delete records whose vector never reached the index.
+
+    Deferred mode commits records right away but writes vectors later, so a
+    crash in between leaves rows that search can never return. Every record or
+    tombstone should have a vector; only a mismatch pays for the id scan.
+    """
+    if records.count() + tombstones <= sum(shard.ntotal for shard in shards):
+        return
+    stored = [_stored_ids(shard) for shard in shards]
+    if any(ids is None for ids in stored):
+        return
+    orphans = np.setdiff1d(records.ids(), np.concatenate(stored))
+    if orphans.size:
+        records.delete(orphans.tolist(), tombstone=False)
+        logger.warning(
+            "Dropped %d records of %s that have no vector", orphans.size, db_file
+        )
+
+
+def _replay_log(index: faiss.Index, log: IndexLog) -> faiss.Index:
+    try:
+        for op, ids, vectors in log.entries():
+            if op == "upsert" and vectors is not None:
+                index = _apply_upsert(index, ids, vectors)
+            else:
+                _apply_remove(index, ids)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to replay index log: {exc}"
+        ) from exc
+    return index
+
+
+def _stat_signature(path: Path) -> tuple[int, int]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _index_signature(db_file: Path, shard_count: int) -> tuple[int, ...]:
+    """(mtime, size) of every shard file and its log, flattened."""
+    signature: list[int] = []
+    for shard in range(shard_count):
+        shard_file = _shard_path(db_file, shard)
+        signature.extend(_stat_signature(shard_file))
+        signature.extend(_stat_signature(_wal_path(shard_file)))
+    return tuple(signature)
+
+
+SearchResult = tuple[np.ndarray, np.ndarray]
+
+
+@dataclass
+class _SearchBatch:
+    parts: list[np.ndarray]
+    rows: int
+    result: SearchResult | None = None
+    error: BaseException | None = None
+
+
+class _SearchCoalescer:
+    """Run concurrent searches that share parameters as one batched faiss call.
+
+    The first caller for a key leads the batch: it waits up to ``max_wait`` for
+    other callers to append their query rows, or until ``max_rows`` is reached,
+    then searches the stacked queries once and hands each caller its slice.
+    A leader with no other search in flight does not wait at all, so a lone
+    client pays no extra latency.
+    """
+
+    def __init__(self, max_rows: int, max_wait: float) -> None:
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._open: dict[Hashable, _SearchBatch] = {}
+        self._active = 0
+
+    def search(
+        self,
+        key: Hashable,
+        queries: np.ndarray,
+        run: Callable[[np.ndarray], SearchResult],
+    ) -> SearchResult:
+        if self.max_rows <= 1 or len(queries) >= self.max_rows:
+            return run(queries)
+
+        with self._cond:
+            self._active += 1
+        try:
+            return self._join(key, queries, run)
+        finally:
+            with self._cond:
+                self._active -= 1
+
+    def _join(
+        self,
+        key: Hashable,
+        queries: np.ndarray,
+        run: Callable[[np.ndarray], SearchResult],
+    ) -> SearchResult:
+        with self._cond:
+            batch = self._open.get(key)
+            if batch is not None and batch.rows + len(queries) <= self.max_rows:
+                return self._follow(batch, queries)
+            batch = self._open[key] = _SearchBatch([queries], len(queries))
+            # Only wait for company when other searches are in flight.
+            if self._active > 1:
+                deadline = time.monotonic() + self.max_wait
+                while batch.rows < self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            if self._open.get(key) is batch:
+                del self._open[key]
+
+        try:
+            scores, labels = run(np.vstack(batch.parts))
+        except BaseException as exc:
+            with self._cond:
+                batch.error = exc
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            batch.result = (scores, labels)
+            self._cond.notify_all()
+        return scores[: len(queries)], labels[: len(queries)]
+
+    def _follow(self, batch: _SearchBatch, queries: np.ndarray) -> SearchResult:
+        # Called with the condition held.
+        start = batch.rows
+        batch.parts.append(queries)
+        batch.rows += len(queries)
+        self._cond.notify_all()
+        while batch.result is None and batch.error is None:
+            self._cond.wait()
+        if batch.error is not None:
+            raise RuntimeError("Batched search failed") from batch.error
+        scores, labels = batch.result
+        stop = start + len(queries)
+        return scores[start:stop], labels[start:stop]
+
+
+@dataclass
+class _CachedIndex:
+    # One faiss index and log per shard; unsharded indexes have exactly one.
+    shards: list[faiss.Index]
+    records: RecordStore
+    logs: list[IndexLog]
+    metric: MetricName
+    store_vectors: bool
+    signature: tuple[int, ...]
+    nbytes: int
+    # Memory-mapped, read-only index: mutating it aborts the process inside faiss.
+    read_only: bool = False
+    # Ids deleted from the records but still in the index until compaction.
+    tombstones: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    # Shards mutated in memory but not yet written (deferred persistence only).
+    dirty: set[int] = field(default_factory=set)
+    coalescer: _SearchCoalescer = field(
+        default_factory=lambda: _SearchCoalescer(
+            FAISS_SEARCH_BATCH_MAX, FAISS_SEARCH_BATCH_WAIT_MS / 1000
+        )
+    )
+
+    @property
+    def dimension(self) -> int:
+        return self.shards[0].d
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards)
+
+    @property
+    def is_trained(self) -> bool:
+        return all(shard.is_trained for shard in self.shards)
+
+    @property
+    def live_total(self) -> int:
+        return self.ntotal - self.tombstones.size
+
+
+class _IndexCache:
+    """LRU cache of loaded indexes and their record stores, keyed by normalized db path.
+
+    Entries are validated against the mtime/size of the index file and its log
+    on every lookup, so indexes changed behind the server's back are reloaded.
+    Loading replays any log entries that were not checkpointed before a crash.
+
+    Read paths get a memory-mapped, read-only index when FAISS_MMAP_READS is on
+    and there is no log to replay; asking for a writable entry replaces it with
+    a fully loaded copy.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Path, _CachedIndex] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, db_file: Path, writable: bool = False) -> _CachedIndex:
+        with self._lock:
+            entry = self._entries.get(db_file)
+        if entry is not None:
+            signature = _index_signature(db_file, len(entry.shards))
+            with self._lock:
+                if self._entries.get(db_file) is entry:
+                    if entry.signature == signature and not (
+                        writable and entry.read_only
+                    ):
+                        self._entries.move_to_end(db_file)
+                        INDEX_CACHE_LOOKUPS.labels("hit").inc()
+                        return entry
+                    self._pop(db_file)
+        INDEX_CACHE_LOOKUPS.labels("miss").inc()
+
+        records = _open_records(db_file)
+        shard_files = [
+            _shard_path(db_file, shard)
+            for shard in range(int(records.get_setting("shards", 1)))
+        ]
+        signature = _index_signature(db_file, len(shard_files))
+        logs = [IndexLog(_wal_path(shard_file)) for shard_file in shard_files]
+        read_only = (
+            FAISS_MMAP_READS and not writable and all(log.size() == 0 for log in logs)
+        )
+        io_flags = 0
+        if read_only:
+            io_flags = _mmap_flags(records.get_setting("index_type", "flat"))
+            read_only = io_flags != 0
+        load_mode = "mmap" if read_only else "full"
+        with INDEX_LOAD_SECONDS.labels(load_mode).time():
+            shards = [_read_index(shard_file, io_flags) for shard_file in shard_files]
+            if not read_only:
+                shards = [_replay_log(index, log) for index, log in zip(shards, logs)]
+        tombstones = records.tombstones()
+        _drop_orphan_records(db_file, records, shards, tombstones.size)
+        INDEX_READ_BYTES.labels(load_mode).inc(sum(signature[1::2]))
+        entry = _CachedIndex(
+            shards=shards,
+            records=records,
+            logs=logs,
+            metric=_stored_metric(records),
+            store_vectors=bool(records.get_setting("store_vectors", False)),
+            signature=signature,
+            nbytes=sum(signature[1::2]),
+            read_only=read_only,
+            tombstones=tombstones,
+        )
+        self._put(db_file, entry)
+        if entry.tombstones.size:
+            # Left over from deletes whose compaction never ran, e.g. after a restart.
+            _schedule_compaction(db_file)
+        return entry
+
+    def refresh(self, db_file: Path, entry: _CachedIndex) -> None:
+        """Re-register an entry after its files were rewritten by this process."""
+        entry.signature = _index_signature(db_file, len(entry.shards))
+        entry.nbytes = sum(entry.signature[1::2])
+        with self._lock:
+            self._pop(db_file)
+        self._put(db_file, entry)
+
+    def invalidate(self, db_file: Path) -> None:
+        with self._lock:
+            self._pop(db_file)
+
+    def _put(self, db_file: Path, entry: _CachedIndex) -> None:
+        if entry.nbytes > self.max_bytes and not entry.dirty:
+            return
+        with self._lock:
+            self._pop(db_file)
+            self._entries[db_file] = entry
+            self._total_bytes += entry.nbytes
+            while self._total_bytes > self.max_bytes:
+                # Entries with unflushed mutations stay until the writer saves them.
+                victim = next(
+                    (
+                        path
+                        for path, cached in self._entries.items()
+                        if not cached.dirty
+                    ),
+                    None,
+                )
+                if victim is None:
+                    break
+                self._pop(victim)
+
+    def _pop(self, db_file: Path) -> None:
+        entry = self._entries.pop(db_file, None)
+        if entry is not None:
+            self._total_bytes -= entry.nbytes
+
+
+_index_cache = _IndexCache(FAISS_CACHE_MAX_BYTES)
+
+
+class _ReadWriteLock:
+    """Many concurrent readers or a single writer.
+
+    Waiting writers block new readers so a steady stream of searches cannot
+    starve an upsert. Not reentrant: never take it twice on one thread.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+# One lock per index path, kept for the life of the process so it outlives
+# cache evictions of the index it guards.
+_index_locks: dict[Path, _ReadWriteLock] = {}
+_index_locks_guard = threading.Lock()
+
+
+def _index_lock(db_file: Path) -> _ReadWriteLock:
+    with _index_locks_guard:
+        lock = _index_locks.get(db_file)
+        if lock is None:
+            lock = _index_locks[db_file] = _ReadWriteLock()
+        return lock
+
+
+# Progress of recent streaming ingests, oldest first, polled by ingest_id.
+_MAX_TRACKED_INGESTS = 256
+_ingest_progress: OrderedDict[str, IngestProgress] = OrderedDict()
+_ingest_lock = threading.Lock()
+
+
+def _track_ingest(progress: IngestProgress) -> None:
+    with _ingest_lock:
+        _ingest_progress[progress.ingest_id] = progress
+        _ingest_progress.move_to_end(progress.ingest_id)
+        while len(_ingest_progress) > _MAX_TRACKED_INGESTS:
+            _ingest_progress.popitem(last=False)
+
+
+def _checkpoint(
+    db_file: Path, entry: _CachedIndex, shards: Iterable[int] | None = None
+) -> None:
+    """Rewrite the given shards (default: all) and drop their logs."""
+    for shard in range(len(entry.shards)) if shards is None else shards:
+        _write_index(entry.shards[shard], _shard_path(db_file, shard))
+        entry.logs[shard].truncate()
+
+
+def _append_log(
+    entry: _CachedIndex,
+    shard: int,
+    op: LogOp,
+    ids: np.ndarray,
+    vectors: np.ndarray | None = None,
+) -> None:
+    try:
+        written = entry.logs[shard].append(op, ids, vectors)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to append to index log: {exc}"
+        ) from exc
+    INDEX_WRITTEN_BYTES.labels("log").inc(written)
+
+
+def _commit_upsert(
+    db_file: Path, entry: _CachedIndex, ids: np.ndarray, vectors: np.ndarray
+) -> None:
+    """Apply an upsert to the cached index and make it durable per FAISS_PERSIST_MODE.
+
+    Each id goes to the shard its hash selects; only those shards are touched.
+    """
+    if entry.read_only:
+        raise RuntimeError("Refusing to mutate a memory-mapped read-only index")
+    touched: list[int] = []
+    for shard, positions in _split_by_shard(ids, len(entry.shards)):
+        shard_ids, shard_vectors = ids[positions], vectors[positions]
+        if FAISS_PERSIST_MODE == "wal":
+            _append_log(entry, shard, "upsert", shard_ids, shard_vectors)
+        entry.shards[shard] = _apply_upsert(
+            entry.shards[shard], shard_ids, shard_vectors
+        )
+        touched.append(shard)
+
+    if FAISS_PERSIST_MODE == "deferred":
+        _flusher.mark(db_file, entry, touched)
+        return
+    if FAISS_PERSIST_MODE == "wal":
+        touched = [
+            shard
+            for shard in touched
+            if entry.logs[shard].size() >= FAISS_WAL_CHECKPOINT_BYTES
+        ]
+    _checkpoint(db_file, entry, touched)
+
+
+def _rebuild_without(index: faiss.Index, ids: np.ndarray) -> faiss.Index:
+    """Copy of an index that cannot remove vectors (HNSW), minus ``ids``.
+
+    The graph is rebuilt from the surviving vectors, so this costs as much as
+    indexing them again.
+    """
+    stored_ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(stored_ids, ids)
+    vectors = index.index.reconstruct_n(0, index.ntotal)[keep]
+    rebuilt = faiss.clone_index(index)
+    rebuilt.reset()
+    if keep.any():
+        rebuilt.add_with_ids(vectors, stored_ids[keep])
+    return rebuilt
+
+
+def _commit_remove(db_file: Path, entry: _CachedIndex, ids: np.ndarray) -> None:
+    """Remove ids from the cached index and make it durable per FAISS_PERSIST_MODE."""
+    if entry.read_only:
+        raise RuntimeError("Refusing to mutate a memory-mapped read-only index")
+    touched: list[int] = []
+    for shard, positions in _split_by_shard(ids, len(entry.shards)):
+        shard_ids = ids[positions]
+        touched.append(shard)
+        if not _supports_remove(entry.shards[shard]):
+            # Rebuilt shards are always checkpointed; there is no log entry for it.
+            entry.shards[shard] = _rebuild_without(entry.shards[shard], shard_ids)
+            continue
+        if FAISS_PERSIST_MODE == "wal":
+            _append_log(entry, shard, "remove", shard_ids)
+        _apply_remove(entry.shards[shard], shard_ids)
+
+    if FAISS_PERSIST_MODE == "deferred":
+        _flusher.mark(db_file, entry, touched)
+        return
+    if FAISS_PERSIST_MODE == "wal":
+        touched = [
+            shard
+            for shard in touched
+            if not _supports_remove(entry.shards[shard])
+            or entry.logs[shard].size() >= FAISS_WAL_CHECKPOINT_BYTES
+        ]
+    _checkpoint(db_file, entry, touched)
+
+
+@dataclass
+class _PendingFlush:
+    entry: _CachedIndex
+    since: float
+    mutations: int = 0
+
+
+class _DeferredFlusher:
+    """Background writer for FAISS_PERSIST_MODE=deferred.
+
+    Commits only mark the shards they touched; this thread rewrites them (via
+    the usual temp file + rename) once the oldest unflushed mutation of an
+    index is ``interval`` seconds old or ``max_mutations`` have piled up, so a
+    burst of small upserts costs one index write instead of one each.
+    """
+
+    def __init__(self, interval: float, max_mutations: int) -> None:
+        self.interval = interval
+        self.max_mutations = max_mutations
+        self._cond = threading.Condition()
+        self._pending: dict[Path, _PendingFlush] = {}
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    def mark(self, db_file: Path, entry: _CachedIndex, shards: Iterable[int]) -> None:
+        """Record unsaved shards; the caller holds the index write lock."""
+        entry.dirty.update(shards)
+        with self._cond:
+            pending = self._pending.get(db_file)
+            if pending is None or pending.entry is not entry:
+                pending = self._pending[db_file] = _PendingFlush(
+                    entry, time.monotonic()
+                )
+            pending.mutations += 1
+            closed = self._closed
+            if not closed and self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="faiss-flusher", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify_all()
+        if closed:
+            self.flush(db_file, entry)
+
+    def flush(self, db_file: Path, entry: _CachedIndex) -> None:
+        """Write the entry's dirty shards now; the caller holds the index write lock."""
+        with self._cond:
+            pending = self._pending.get(db_file)
+            if pending is None or pending.entry is not entry:
+                return
+            del self._pending[db_file]
+        shards = sorted(entry.dirty)
+        try:
+            _checkpoint(db_file, entry, shards)
+        except Exception:
+            # Keep the changes queued so the writer retries them.
+            with self._cond:
+                self._pending.setdefault(
+                    db_file, _PendingFlush(entry, time.monotonic())
+                )
+            raise
+        entry.dirty.clear()
+        _index_cache.refresh(db_file, entry)
+
+    def discard(self, db_file: Path) -> None:
+        """Forget unsaved changes of an index that is being replaced."""
+        with self._cond:
+            pending = self._pending.pop(db_file, None)
+        if pending is not None:
+            pending.entry.dirty.clear()
+
+    def close(self) -> None:
+        """Stop the writer thread and flush everything still pending."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        with self._cond:
+            remaining = [(path, p.entry) for path, p in self._pending.items()]
+        for db_file, entry in remaining:
+            self._flush_locked(db_file, entry)
+
+    def _due(self, now: float) -> list[tuple[Path, _CachedIndex]]:
+        return [
+            (db_file, pending.entry)
+            for db_file, pending in self._pending.items()
+            if pending.mutations >= self.max_mutations
+            or now - pending.since >= self.interval
+        ]
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                due = self._due(time.monotonic())
+                while not due and not self._closed:
+                    wait = None
+                    if self._pending:
+                        oldest = min(p.since for p in self._pending.values())
+                        wait = max(0.0, oldest + self.interval - time.monotonic())
+                    self._cond.wait(wait)
+                    due = self._due(time.monotonic())
+                if self._closed:
+                    return
+            for db_file, entry in due:
+                self._flush_locked(db_file, entry)
+
+    def _flush_locked(self, db_file: Path, entry: _CachedIndex) -> None:
+        try:
+            with _index_lock(db_file).write():
+                self.flush(db_file, entry)
+        except Exception:
+            logger.exception("Flushing %s failed; retrying later", db_file)
+
 
-    wrapped = faiss.IndexIDMap2(loaded)
-    return wrapped
+_flusher = _DeferredFlusher(FAISS_FLUSH_INTERVAL_MS / 1000, FAISS_FLUSH_MAX_MUTATIONS)
+
+
+def _drop_cached(db_file: Path, entry: _CachedIndex) -> None:
+    """Drop an entry after a failed mutation so the next request reloads it.
+
+    Changes the deferred writer has not saved yet are written first, otherwise
+    the reload would lose mutations that were already acknowledged.
+    """
+    try:
+        _flusher.flush(db_file, entry)
+    finally:
+        _index_cache.invalidate(db_file)
+
+
+# Deletes only tombstone ids; a single background worker later removes their
+# vectors from the index, coalescing every delete queued in the meantime.
+_compaction_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="faiss-compaction"
+)
+_compaction_pending: set[Path] = set()
+_compaction_guard = threading.Lock()
+
+
+def _schedule_compaction(db_file: Path) -> None:
+    with _compaction_guard:
+        if db_file in _compaction_pending:
+            return
+        _compaction_pending.add(db_file)
+    _compaction_executor.submit(_compact, db_file)
+
+
+def _compact(db_file: Path) -> None:
+    with _compaction_guard:
+        _compaction_pending.discard(db_file)
+    if not db_file.exists():
+        return
+
+    try:
+        with _index_lock(db_file).write():
+            entry = _index_cache.get(db_file, writable=True)
+            tombstones = entry.tombstones
+            if not tombstones.size:
+                return
+            try:
+                _commit_remove(db_file, entry, tombstones)
+            except Exception:
+                _drop_cached(db_file, entry)
+                raise
+            # In deferred mode the removal so far only marked shards dirty; write
+            # them out first. Tombstones are cleared only once the removal is
+            # durable; a crash in between just means the next compaction removes
+            # ids that are already gone.
+            _flusher.flush(db_file, entry)
+            entry.records.clear_tombstones(tombstones.tolist())
+            entry.tombstones = entry.records.tombstones()
+            _index_cache.refresh(db_file, entry)
+    except Exception:
+        logger.exception("Compacting %s failed", db_file)
+
+
+_shard_search_executor = ThreadPoolExecutor(
+    max_workers=FAISS_SHARD_SEARCH_THREADS, thread_name_prefix="faiss-shard-search"
+)
+
+
+def _search_shards(
+    entry: _CachedIndex,
+    queries: np.ndarray,
+    k: int,
+    nprobe: int | None,
+    ef_search: int | None,
+    selector: faiss.IDSelector | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Search every shard and merge the per-shard top k into one ranking.
+
+    Each shard search gets its own parameters: IndexIDMap swaps ``params.sel``
+    for an id-translating wrapper while it searches, so a shared object would
+    leak one shard's id map into another's concurrent search. The selector
+    itself is read-only and safe to share.
+    """
+
+    def search(shard: faiss.Index) -> SearchResult:
+        params = _search_params(shard, nprobe, ef_search, selector)
+        return shard.search(queries, k, params=params)
+
+    if len(entry.shards) == 1:
+        return search(entry.shards[0])
+
+    results = list(_shard_search_executor.map(search, entry.shards))
+    scores = np.stack([shard_scores for shard_scores, _ in results])
+    labels = np.stack([shard_labels for _, shard_labels in results])
+    return faiss.merge_knn_results(scores, labels, keep_max=entry.metric != "l2")
+
+
+def _post_filtered_search(
+    entry: _CachedIndex,
+    queries: np.ndarray,
+    k: int,
+    nprobe: int | None,
+    ef_search: int | None,
+    allowed: np.ndarray | None = None,
+    excluded: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Search an index that rejects ID selectors, dropping unwanted ids afterwards.
+
+    Only ``allowed`` ids are kept when given, and ``excluded`` ids are dropped.
+    The candidate depth starts from the wanted share of the index and doubles
+    until every query keeps k hits or the whole index has been searched.
+    """
+    total = entry.ntotal
+    if allowed is not None:
+        wanted = allowed.size
+    else:
+        wanted = total - (excluded.size if excluded is not None else 0)
+    fetch = min(total, max(2 * k, math.ceil(2 * k * total / max(wanted, 1))))
+    while True:
+        scores, labels = _search_shards(entry, queries, fetch, nprobe, ef_search)
+        keep = labels >= 0
+        if allowed is not None:
+            keep &= np.isin(labels, allowed)
+        if excluded is not None:
+            keep &= ~np.isin(labels, excluded)
+        if fetch >= total or (keep.sum(axis=1) >= k).all():
+            break
+        fetch = min(total, fetch * 2)
+
+    out_scores = np.full(
+        (len(queries), k),
+        np.inf if entry.metric == "l2" else -np.inf,
+        dtype=np.float32,
+    )
+    out_labels = np.full((len(queries), k), -1, dtype=np.int64)
+    for row in range(len(queries)):
+        cols = np.flatnonzero(keep[row])[:k]
+        out_scores[row, : cols.size] = scores[row, cols]
+        out_labels[row, : cols.size] = labels[row, cols]
+    return out_scores, out_labels
+
+
+def _rerank(
+    entry: _CachedIndex,
+    queries: np.ndarray,
+    scores: np.ndarray,
+    labels: np.ndarray,
+    k: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Re-score approximate candidates exactly and keep the best k per query.
+
+    Candidates whose full-precision vector is missing keep their index score.
+    """
+    stored = entry.records.get_vectors(
+        int(label) for label in labels.ravel() if label >= 0
+    )
+    higher_is_better = entry.metric != "l2"
+
+    out_scores = np.full(
+        (len(queries), k), -np.inf if higher_is_better else np.inf, dtype=np.float32
+    )
+    out_labels = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, query in enumerate(queries):
+        exact = scores[row].copy()
+        for col, label in enumerate(labels[row]):
+            vector = stored.get(int(label)) if label >= 0 else None
+            if vector is None:
+                continue
+            if higher_is_better:
+                exact[col] = float(np.dot(query, vector))
+            else:
+                diff = query - vector
+                exact[col] = float(np.dot(diff, diff))
+        valid = labels[row] >= 0
+        order = np.argsort(-exact if higher_is_better else exact, kind="stable")
+        order = order[valid[order]][:k]
+        out_scores[row, : len(order)] = exact[order]
+        out_labels[row, : len(order)] = labels[row][order]
+    return out_scores, out_labels
+
+
+# Hybrid search fuses the top k * _HYBRID_DEPTH candidates of each ranking.
+_HYBRID_DEPTH = 4
+
+
+def _reciprocal_rank_fusion(
+    rankings: list[list[int]], rrf_k: int, k: int
+) -> list[tuple[int, float]]:
+    """Fuse best-first id rankings by summing 1 / (rrf_k + rank) per id."""
+    fused: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda hit: hit[1], reverse=True)[:k]
 
 
 @app.get("/health")
@@ -196,48 +1512,186 @@ def list_indexes(
         raise HTTPException(status_code=404, detail="base_dir not found")
 
     pattern = "**/*.faiss" if recursive else "*.faiss"
-    files = sorted(root.glob(pattern), key=lambda p: str(p))
     indexes = [
         IndexEntry(
             name=path.stem,
-            db_path=str(path.resolve()),
+            db_path=str(path),
         )
-        for path in files
-        if path.is_file()
+        for path in _discover_indexes(root, pattern)
     ]
     return ListIndexesResponse(base_dir=str(root), indexes=indexes)
 
 
+def _discover_indexes(root: Path, pattern: str) -> list[Path]:
+    """Index files under root matching a glob, without the extra files of sharded indexes.
+
+    Raises ValueError for patterns that could reach outside ``root``; matches
+    that resolve outside it (through symlinks) are skipped.
+    """
+    if Path(pattern).is_absolute() or ".." in Path(pattern).parts:
+        raise ValueError("pattern must be relative and stay inside base_dir")
+    root = root.resolve()
+    files = sorted(root.glob(pattern), key=lambda p: str(p))
+    return [
+        path.resolve()
+        for path in files
+        if path.suffix == ".faiss"
+        and path.is_file()
+        and not _SHARD_STEM.search(path.stem)
+        and path.resolve().is_relative_to(root)
+    ]
+
+
 @app.post("/faiss/indexes/create")
 def create_index(payload: CreateIndexRequest) -> InfoResponse:
     db_file = _resolve_create_db_path(payload)
 
-    if db_file.exists() and not payload.overwrite:
-        raise HTTPException(status_code=400, detail="Index already exists.")
+    with _index_lock(db_file).write():
+        if db_file.exists() and not payload.overwrite:
+            raise HTTPException(status_code=400, detail="Index already exists.")
 
-    db_file.parent.mkdir(parents=True, exist_ok=True)
-    index = _new_index(payload.dimension, payload.metric)
+        db_file.parent.mkdir(parents=True, exist_ok=True)
+        _flusher.discard(db_file)
+        _index_cache.invalidate(db_file)
+        description = _index_description(payload)
+        try:
+            index = _new_index(payload.dimension, payload.metric, description)
+        except Exception as exc:
+            raise HTTPException(
+                status_code=400, detail=f"Invalid index configuration: {exc}"
+            ) from exc
+        _configure_search_defaults(index, payload)
+        index_type = payload.index_type if payload.factory is None else description
+        if payload.factory is not None:
+            storage = _factory_storage(description)
+        else:
+            storage = "pq" if payload.index_type == "ivf_pq" else payload.storage
+        store_vectors = payload.store_vectors
+        if store_vectors is None:
+            store_vectors = _is_lossy(payload)
+
+        for shard in range(_MAX_SHARDS):
+            shard_file = _shard_path(db_file, shard)
+            if shard < payload.shards:
+                _write_index(index, shard_file)
+            else:
+                # Left over from an overwritten index that had more shards.
+                shard_file.unlink(missing_ok=True)
+            IndexLog(_wal_path(shard_file)).truncate()
 
-    try:
-        faiss.write_index(index, str(db_file))
-    except Exception as exc:
-        raise HTTPException(
-            status_code=500, detail=f"Failed to write index: {exc}"
-        ) from exc
+        try:
+            RecordStore(_records_path(db_file)).reset(
+                dimension=payload.dimension,
+                metric=payload.metric,
+                index_type=index_type,
+                storage=storage,
+                store_vectors=store_vectors,
+                shards=payload.shards,
+            )
+            _meta_path(db_file).unlink(missing_ok=True)
+        except Exception as exc:
+            raise HTTPException(
+                status_code=500, detail=f"Failed to write metadata: {exc}"
+            ) from exc
+
+        return InfoResponse(
+            db_path=str(db_file),
+            total=0,
+            dimension=payload.dimension,
+            metric=payload.metric,
+            index_type=index_type,
+            storage=storage,
+            is_trained=index.is_trained,
+            shards=payload.shards,
+        )
 
-    meta = {
-        "dimension": payload.dimension,
-        "metric": payload.metric,
-        "records": {},
-    }
-    _save_meta(db_file, meta)
 
-    return InfoResponse(
-        db_path=str(db_file),
-        total=0,
-        dimension=payload.dimension,
-        metric=payload.metric,
-    )
+def _decode_vectors(buffer: bytes, count: int, dimension: int) -> np.ndarray:
+    """View an uploaded buffer as a (count, dimension) float32 matrix.
+
+    Accepts ``.npy`` files (detected by their magic) or raw little-endian
+    float32 in row-major order. Little-endian float32 C-order input is wrapped
+    without copying.
+    """
+    if buffer.startswith(b"\x93NUMPY"):
+        stream = io.BytesIO(buffer)
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+        if dtype.kind != "f" or len(shape) != 2:
+            raise ValueError(f"expected a 2-d float array, got {dtype} {shape}")
+        array = np.frombuffer(
+            buffer, dtype=dtype, count=shape[0] * shape[1], offset=stream.tell()
+        )
+        array = array.reshape(shape[::-1]).T if fortran_order else array.reshape(shape)
+    else:
+        if len(buffer) % 4 != 0:
+            raise ValueError("raw buffer length is not a multiple of 4 bytes")
+        array = np.frombuffer(buffer, dtype="<f4")
+        if array.size != count * dimension:
+            raise ValueError(
+                f"expected {count} x {dimension} float32 values, got {array.size}"
+            )
+        array = array.reshape(count, dimension)
+
+    if array.shape != (count, dimension):
+        raise ValueError(f"expected shape ({count}, {dimension}), got {array.shape}")
+    return np.ascontiguousarray(array, dtype=np.float32)
+
+
+def _upsert_batch(
+    db_file: Path, ids: np.ndarray, vectors: np.ndarray, rows: list[RecordRow]
+) -> dict[str, Any]:
+    """Add or replace vectors and their records; shared by every upsert endpoint."""
+    UPSERT_VECTORS.observe(len(ids))
+    with _index_lock(db_file).write():
+        entry = _index_cache.get(db_file, writable=True)
+        dimension = entry.dimension
+        metric = entry.metric
+
+        if vectors.ndim != 2 or vectors.shape[1] != dimension:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Vector dimension mismatch. Expected {dimension}, got {vectors.shape[1] if vectors.ndim == 2 else 'invalid'}.",
+            )
+
+        if metric == "cosine":
+            if not vectors.flags.writeable:
+                vectors = vectors.copy()
+            faiss.normalize_L2(vectors)
+
+        try:
+            _ensure_trained(db_file, entry, vectors)
+            _commit_upsert(db_file, entry, ids, vectors)
+
+            try:
+                entry.records.upsert(
+                    rows, vectors=vectors if entry.store_vectors else None
+                )
+            except Exception as exc:
+                raise HTTPException(
+                    status_code=500, detail=f"Failed to save metadata: {exc}"
+                ) from exc
+        except Exception:
+            # The cached index was mutated in place; drop it so the next request
+            # reloads whatever actually made it to disk.
+            _drop_cached(db_file, entry)
+            raise
+
+        if entry.tombstones.size:
+            # Re-upserted ids replaced their vectors and are no longer deleted.
+            entry.tombstones = np.setdiff1d(entry.tombstones, ids)
+        _index_cache.refresh(db_file, entry)
+
+        return {
+            "db_path": str(db_file),
+            "upserted": len(rows),
+            "total": entry.live_total,
+            "dimension": dimension,
+            "metric": metric,
+        }
 
 
 @app.post("/faiss/indexes/upsert")
@@ -249,57 +1703,86 @@ def upsert_items(payload: UpsertRequest) -> dict[str, Any]:
             status_code=404, detail="Index file not found. Create the index first."
         )
 
-    index = _read_index(db_file)
-    meta = _load_meta(db_file)
-
-    dimension = index.d
-    metric = meta.get("metric", "cosine")
-    if metric not in {"cosine", "l2", "ip"}:
-        metric = "cosine"
-
     vectors = np.array([item.vector for item in payload.items], dtype=np.float32)
-    if vectors.ndim != 2 or vectors.shape[1] != dimension:
+    ids = np.array([item.id for item in payload.items], dtype=np.int64)
+    rows = [(item.id, item.text, item.metadata) for item in payload.items]
+    return _upsert_batch(db_file, ids, vectors, rows)
+
+
+@app.post("/faiss/indexes/upsert/binary")
+def upsert_items_binary(
+    db_path: str = Form(..., min_length=1),
+    records: str = Form(...),
+    vectors: UploadFile = File(...),
+) -> dict[str, Any]:
+    """Upsert with vectors as a packed float32 buffer instead of JSON numbers.
+
+    ``records`` is a JSON object with ``ids`` and optional ``texts`` and
+    ``metadata`` columns; ``vectors`` holds one row per id, either as raw
+    little-endian float32 or as a ``.npy`` file.
+    """
+    db_file = _normalize_db_path(db_path)
+
+    if not db_file.exists():
         raise HTTPException(
-            status_code=400,
-            detail=f"Vector dimension mismatch. Expected {dimension}, got {vectors.shape[1] if vectors.ndim == 2 else 'invalid'}.",
+            status_code=404, detail="Index file not found. Create the index first."
         )
 
-    ids = np.array([item.id for item in payload.items], dtype=np.int64)
+    try:
+        columns = BinaryUpsertRecords.model_validate_json(records)
+    except ValidationError as exc:
+        raise HTTPException(
+            status_code=422,
+            detail=exc.errors(include_url=False, include_context=False),
+        ) from exc
 
-    if metric == "cosine":
-        faiss.normalize_L2(vectors)
+    with _index_lock(db_file).read():
+        dimension = _index_cache.get(db_file).dimension
+    try:
+        matrix = _decode_vectors(vectors.file.read(), len(columns.ids), dimension)
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid vector payload: {exc}"
+        ) from exc
 
-    selector = faiss.IDSelectorArray(ids.size, faiss.swig_ptr(ids))
-    index.remove_ids(selector)
-    index.add_with_ids(vectors, ids)
+    ids = np.array(columns.ids, dtype=np.int64)
+    return _upsert_batch(db_file, ids, matrix, columns.rows())
 
-    records: dict[str, Any] = meta.get("records", {})
-    for item in payload.items:
-        records[str(item.id)] = {
-            "text": item.text,
-            "metadata": item.metadata,
-        }
 
-    meta["records"] = records
-    meta["dimension"] = dimension
-    meta["metric"] = metric
+@app.post("/faiss/indexes/delete")
+def delete_items(payload: DeleteRequest) -> DeleteResponse:
+    """Delete records by id or metadata filter.
 
-    try:
-        faiss.write_index(index, str(db_file))
-    except Exception as exc:
-        raise HTTPException(
-            status_code=500, detail=f"Failed to save index: {exc}"
-        ) from exc
+    Records disappear from content, search and info right away; their vectors
+    are tombstoned and removed from the index by a background compaction.
+    """
+    db_file = _normalize_db_path(payload.db_path)
+    if not db_file.exists():
+        raise HTTPException(status_code=404, detail="Index not found")
 
-    _save_meta(db_file, meta)
+    with _index_lock(db_file).write():
+        entry = _index_cache.get(db_file)
+        if payload.filter is not None:
+            ids = entry.records.filter_ids(payload.filter).tolist()
+        else:
+            ids = payload.ids or []
+        try:
+            deleted = entry.records.delete(ids)
+        except Exception as exc:
+            raise HTTPException(
+                status_code=500, detail=f"Failed to delete records: {exc}"
+            ) from exc
+        entry.tombstones = entry.records.tombstones()
+        response = DeleteResponse(
+            db_path=str(db_file),
+            deleted=len(deleted),
+            total=entry.live_total,
+            pending_compaction=entry.tombstones.size,
+        )
 
-    return {
-        "db_path": str(db_file),
-        "upserted": len(payload.items),
-        "total": index.ntotal,
-        "dimension": dimension,
-        "metric": metric,
-    }
+    if response.pending_compaction:
+        _schedule_compaction(db_file)
+    return response
 
 
 @app.get("/faiss/indexes/info")
@@ -308,19 +1791,20 @@ def get_info(db_path: str = Query(..., min_length=1)) -> InfoResponse:
     if not db_file.exists():
         raise HTTPException(status_code=404, detail="Index not found")
 
-    index = _read_index(db_file)
-    meta = _load_meta(db_file)
-
-    metric = meta.get("metric", "cosine")
-    if metric not in {"cosine", "l2", "ip"}:
-        metric = "cosine"
-
-    return InfoResponse(
-        db_path=str(db_file),
-        total=index.ntotal,
-        dimension=index.d,
-        metric=metric,
-    )
+    with _index_lock(db_file).read():
+        entry = _index_cache.get(db_file)
+
+        return InfoResponse(
+            db_path=str(db_file),
+            total=entry.live_total,
+            dimension=entry.dimension,
+            metric=entry.metric,
+            index_type=entry.records.get_setting("index_type", "flat"),
+            storage=entry.records.get_setting("storage", "float32"),
+            is_trained=entry.is_trained,
+            tombstones=entry.tombstones.size,
+            shards=len(entry.shards),
+        )
 
 
 @app.get("/faiss/indexes/content")
@@ -329,49 +1813,421 @@ def get_content(
     offset: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=500),
     preview_dim: int = Query(8, ge=1, le=64),
+    after_id: int | None = Query(None),
 ) -> ContentResponse:
     db_file = _normalize_db_path(db_path)
     if not db_file.exists():
         raise HTTPException(status_code=404, detail="Index not found")
 
-    index = _read_index(db_file)
-    meta = _load_meta(db_file)
-    records = meta.get("records", {})
+    with _index_lock(db_file).read():
+        entry = _index_cache.get(db_file)
+
+        page = entry.records.page(limit, offset=offset, after_id=after_id)
+        page_ids = np.array([item_id for item_id, _, _ in page], dtype=np.int64)
+        previews: dict[int, list[float]] = {}
+        for shard, positions in _split_by_shard(page_ids, len(entry.shards)):
+            previews.update(
+                _embedding_previews(
+                    entry.shards[shard], page_ids[positions].tolist(), preview_dim
+                )
+            )
+
+        items = [
+            RecordView(
+                id=item_id,
+                text=text,
+                metadata=metadata,
+                embedding_preview=previews.get(item_id, []),
+            )
+            for item_id, text, metadata in page
+        ]
+
+        return ContentResponse(
+            db_path=str(db_file),
+            total=entry.live_total,
+            dimension=entry.dimension,
+            metric=entry.metric,
+            items=items,
+            next_after_id=page[-1][0] if len(page) == limit else None,
+        )
 
-    metric = meta.get("metric", "cosine")
-    if metric not in {"cosine", "l2", "ip"}:
-        metric = "cosine"
 
-    all_items = []
-    for key, value in records.items():
-        try:
-            item_id = int(key)
-        except Exception:
-            continue
-        text = value.get("text", "") if isinstance(value, dict) else ""
-        metadata = value.get("metadata", {}) if isinstance(value, dict) else {}
-        embedding_preview: list[float] = []
+def _embedding_previews(
+    index: faiss.Index, ids: list[int], preview_dim: int
+) -> dict[int, list[float]]:
+    """Leading components of the stored vectors for one page of ids."""
+    if not ids:
+        return {}
+    try:
+        vectors = index.reconstruct_batch(np.array(ids, dtype=np.int64))
+        return {
+            item_id: [float(v) for v in vector[:preview_dim]]
+            for item_id, vector in zip(ids, vectors)
+        }
+    except Exception:
+        pass
+
+    # Some ids have no vector (or the index cannot batch); fall back per id.
+    previews: dict[int, list[float]] = {}
+    for item_id in ids:
         try:
             vector = index.reconstruct(item_id)
-            embedding_preview = [float(v) for v in vector[:preview_dim]]
+            previews[item_id] = [float(v) for v in vector[:preview_dim]]
         except Exception:
-            embedding_preview = []
-        all_items.append(
-            {
-                "id": item_id,
-                "text": text,
-                "metadata": metadata,
-                "embedding_preview": embedding_preview,
-            }
+            previews[item_id] = []
+    return previews
+
+
+@app.post("/faiss/indexes/search")
+def search_index(payload: SearchRequest) -> SearchResponse:
+    db_file = _normalize_db_path(payload.db_path)
+    if not db_file.exists():
+        raise HTTPException(status_code=404, detail="Index not found")
+
+    with _index_lock(db_file).read():
+        entry = _index_cache.get(db_file)
+        metric = entry.metric
+        dimension = entry.dimension
+        if any(len(vector) != dimension for vector in payload.vectors):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Query dimension mismatch. Expected {dimension}.",
+            )
+
+        if payload.rerank and not entry.store_vectors:
+            raise HTTPException(
+                status_code=400,
+                detail="Re-ranking needs an index created with store_vectors enabled.",
+            )
+
+        searchable = entry.live_total
+        # Indexes that reject ID selectors (IndexPQ) get their filter and
+        # tombstones applied to an over-fetched result instead.
+        selectable = _accepts_selector(entry.shards[0])
+        allowed = None
+        selector = None
+        if payload.filter is not None:
+            # Deleted records have no postings, so this already skips tombstones.
+            allowed = entry.records.filter_ids(payload.filter)
+            searchable = min(searchable, allowed.size)
+            if selectable:
+                selector = faiss.IDSelectorBatch(allowed)
+        elif entry.tombstones.size and selectable:
+            tombstoned = faiss.IDSelectorBatch(entry.tombstones)
+            selector = faiss.IDSelectorNot(tombstoned)
+
+        query_count = len(
+            payload.queries if payload.mode == "lexical" else payload.vectors
         )
+        k = min(payload.k, searchable)
+        if k == 0:
+            return SearchResponse(
+                db_path=str(db_file),
+                metric=metric,
+                dimension=dimension,
+                results=[[] for _ in range(query_count)],
+            )
+
+        # Each side of a hybrid search contributes a deeper candidate list so
+        # that documents ranked well by only one of them can still surface.
+        depth = k if payload.mode == "vector" else min(k * _HYBRID_DEPTH, searchable)
+        rankings: list[list[tuple[int, float]]] = []
+        if payload.mode != "lexical":
+            queries = np.array(payload.vectors, dtype=np.float32)
+            if metric == "cosine":
+                faiss.normalize_L2(queries)
+            fetch = depth
+            if payload.rerank:
+                fetch = min(depth * payload.rerank_factor, searchable)
+            stored_total = sum(shard.ntotal for shard in entry.shards)
+
+            def vector_hits(fetch: int, keep: int) -> list[list[tuple[int, float]]]:
+                def run(batch: np.ndarray) -> SearchResult:
+                    if not selectable and (
+                        allowed is not None or entry.tombstones.size
+                    ):
+                        return _post_filtered_search(
+                            entry,
+                            batch,
+                            fetch,
+                            payload.nprobe,
+                            payload.ef_search,
+                            allowed,
+                            None if allowed is not None else entry.tombstones,
+                        )
+                    return _search_shards(
+                        entry, batch, fetch, payload.nprobe, payload.ef_search, selector
+                    )
+
+                if payload.filter is None:
+                    # Unfiltered searches of one index differ only in these values
+                    # (tombstones are shared under the read lock), so they can be
+                    # answered by one faiss call.
+                    scores, labels = entry.coalescer.search(
+                        (fetch, payload.nprobe, payload.ef_search), queries, run
+                    )
+                else:
+                    scores, labels = run(queries)
+                if payload.rerank:
+                    scores, labels = _rerank(entry, queries, scores, labels, keep)
+                return [
+                    [
+                        (int(label), float(score))
+                        for score, label in zip(row_scores, row_labels)
+                        if label >= 0
+                    ]
+                    for row_scores, row_labels in zip(scores, labels)
+                ]
+
+            # Vectors can outlive their record: another worker deleted it and
+            # this one has no tombstone for it yet, or a crash lost it. Such hits
+            # are dropped, and the search goes deeper by as many as were dropped.
+            extra = 0
+            while True:
+                found = vector_hits(fetch + extra, depth + extra)
+                known = entry.records.get_many(
+                    item_id for ranking in found for item_id, _ in ranking
+                )
+                rankings = [
+                    [hit for hit in ranking if hit[0] in known] for ranking in found
+                ]
+                dropped = max(
+                    len(ranking) - len(kept) for ranking, kept in zip(found, rankings)
+                )
+                if dropped <= extra or fetch + extra >= stored_total:
+                    break
+                extra = dropped
+            rankings = [ranking[:depth] for ranking in rankings]
+        if payload.mode == "lexical":
+            rankings = [
+                entry.records.lexical_search(text, k, payload.filter)
+                for text in payload.queries
+            ]
+        elif payload.mode == "hybrid":
+            rankings = [
+                _reciprocal_rank_fusion(
+                    [
+                        [item_id for item_id, _ in vector_hits],
+                        [
+                            item_id
+                            for item_id, _ in entry.records.lexical_search(
+                                text, depth, payload.filter
+                            )
+                        ],
+                    ],
+                    payload.rrf_k,
+                    k,
+                )
+                for vector_hits, text in zip(rankings, payload.queries)
+            ]
+
+        records = entry.records.get_many(
+            item_id for ranking in rankings for item_id, _ in ranking
+        )
+        results: list[list[SearchHit]] = []
+        for ranking in rankings:
+            hits: list[SearchHit] = []
+            for item_id, score in ranking:
+                if item_id not in records:
+                    continue
+                text, metadata = records[item_id]
+                hits.append(
+                    SearchHit(id=item_id, score=score, text=text, metadata=metadata)
+                )
+            results.append(hits)
+
+        return SearchResponse(
+            db_path=str(db_file),
+            metric=metric,
+            dimension=dimension,
+            results=results,
+        )
+
+
+# Federated searches get their own pool: each task runs search_index, which may
+# in turn fan out over _shard_search_executor.
+_federated_search_executor = ThreadPoolExecutor(
+    max_workers=FAISS_SHARD_SEARCH_THREADS,
+    thread_name_prefix="faiss-federated-search",
+)
+_MAX_FEDERATED_INDEXES = 256
+
+
+def _merge_federated(
+    responses: list[SearchResponse], payload: FederatedSearchRequest
+) -> list[list[FederatedHit]]:
+    """One ranking per query over the hits of every index, on normalized scores."""
+    query_count = len(payload.queries if payload.mode == "lexical" else payload.vectors)
+    merged: list[list[FederatedHit]] = []
+    for row in range(query_count):
+        # Raw scores are only comparable between indexes that score the same way.
+        groups: dict[str, list[FederatedHit]] = {}
+        for response in responses:
+            scale = response.metric if payload.mode == "vector" else payload.mode
+            lower_is_better = scale == "l2"
+            for rank, hit in enumerate(response.results[row], start=1):
+                if payload.normalization == "rank":
+                    score = 1.0 / (payload.rrf_k + rank)
+                else:
+                    score = -hit.score if lower_is_better else hit.score
+                groups.setdefault(scale, []).append(
+                    FederatedHit(
+                        **hit.model_dump(exclude={"score"}),
+                        score=score,
+                        db_path=response.db_path,
+                        raw_score=hit.score,
+                    )
+                )
+
+        if payload.normalization == "minmax":
+            for group in groups.values():
+                low = min(hit.score for hit in group)
+                high = max(hit.score for hit in group)
+                for hit in group:
+                    hit.score = (hit.score - low) / (high - low) if high > low else 1.0
+
+        hits = [hit for group in groups.values() for hit in group]
+        hits.sort(key=lambda hit: hit.score, reverse=True)
+        merged.append(hits[: payload.k])
+    return merged
+
+
+@app.post("/faiss/indexes/search/federated")
+def federated_search(payload: FederatedSearchRequest) -> FederatedSearchResponse:
+    """Run one query against several indexes concurrently and merge the hits.
+
+    Every index is searched through ``search_index``, so it is served from the
+    loaded-index cache under its own read lock. Indexes that cannot answer the
+    query (missing, wrong dimension, ...) are reported in ``skipped``.
+    """
+    if payload.db_paths is not None:
+        targets = list(dict.fromkeys(_normalize_db_path(p) for p in payload.db_paths))
+    else:
+        root = Path(payload.base_dir or "").expanduser().resolve()
+        if not root.is_dir():
+            raise HTTPException(status_code=404, detail="base_dir not found")
+        try:
+            targets = _discover_indexes(root, payload.pattern)
+        except (ValueError, NotImplementedError) as exc:
+            raise HTTPException(
+                status_code=400, detail=f"Invalid pattern: {exc}"
+            ) from exc
+    if len(targets) > _MAX_FEDERATED_INDEXES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many indexes ({len(targets)}); at most {_MAX_FEDERATED_INDEXES} per search.",
+        )
+
+    query = payload.model_dump(include=set(SearchQuery.model_fields))
+    futures = {
+        db_file: _federated_search_executor.submit(
+            search_index, SearchRequest(db_path=str(db_file), **query)
+        )
+        for db_file in targets
+    }
+    responses: list[SearchResponse] = []
+    skipped: dict[str, str] = {}
+    for db_file, future in futures.items():
+        try:
+            responses.append(future.result())
+        except HTTPException as exc:
+            skipped[str(db_file)] = str(exc.detail)
+
+    return FederatedSearchResponse(
+        indexes=[response.db_path for response in responses],
+        skipped=skipped,
+        results=_merge_federated(responses, payload),
+    )
+
 
-    all_items.sort(key=lambda item: item["id"])
-    page = all_items[offset : offset + limit]
+@app.post("/faiss/indexes/upsert/stream")
+async def upsert_items_stream(
+    request: Request,
+    db_path: str = Query(..., min_length=1),
+    batch_size: int = Query(1000, ge=1, le=50000),
+    ingest_id: str | None = Query(None, min_length=1, max_length=128),
+) -> IngestProgress:
+    """Upsert newline-delimited JSON items while the body is still uploading.
+
+    Each line is one ``UpsertItem``. Items are committed in micro-batches of
+    ``batch_size`` as they arrive, so memory stays bounded by one batch no matter
+    how large the upload is. Progress can be polled with the same ``ingest_id``
+    from ``/faiss/indexes/upsert/stream/progress``.
+    """
+    db_file = _normalize_db_path(db_path)
 
-    return ContentResponse(
-        db_path=str(db_file),
-        total=index.ntotal,
-        dimension=index.d,
-        metric=metric,
-        items=[RecordView(**item) for item in page],
+    if not db_file.exists():
+        raise HTTPException(
+            status_code=404, detail="Index file not found. Create the index first."
+        )
+
+    progress = IngestProgress(
+        ingest_id=ingest_id or uuid.uuid4().hex, db_path=str(db_file)
     )
+    _track_ingest(progress)
+
+    batch: dict[int, UpsertItem] = {}
+
+    async def flush() -> None:
+        if not batch:
+            return
+        items = list(batch.values())
+        batch.clear()
+        vectors = np.array([item.vector for item in items], dtype=np.float32)
+        ids = np.array([item.id for item in items], dtype=np.int64)
+        rows = [(item.id, item.text, item.metadata) for item in items]
+        result = await run_in_threadpool(_upsert_batch, db_file, ids, vectors, rows)
+        progress.upserted += len(items)
+        progress.batches += 1
+        progress.total = result["total"]
+
+    async def handle(line: bytes) -> None:
+        progress.lines += 1
+        if not line.strip():
+            return
+        try:
+            item = UpsertItem.model_validate_json(line)
+        except ValidationError as exc:
+            # Everything before the bad line is committed, like separate requests.
+            await flush()
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid item on line {progress.lines} after {progress.upserted} upserted items: {exc.errors(include_url=False, include_context=False)}",
+            ) from exc
+        # A repeated id starts a new batch so later lines win, as in sequential upserts.
+        if item.id in batch:
+            await flush()
+        batch[item.id] = item
+        if len(batch) >= batch_size:
+            await flush()
+
+    try:
+        pending = b""
+        async for chunk in request.stream():
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                await handle(line)
+        if pending:
+            await handle(pending)
+        await flush()
+    except HTTPException as exc:
+        progress.status = "failed"
+        progress.error = str(exc.detail)
+        raise
+    except Exception as exc:
+        progress.status = "failed"
+        progress.error = str(exc)
+        raise
+
+    progress.status = "done"
+    return progress
+
+
+@app.get("/faiss/indexes/upsert/stream/progress")
+def get_ingest_progress(ingest_id: str = Query(..., min_length=1)) -> IngestProgress:
+    with _ingest_lock:
+        progress = _ingest_progress.get(ingest_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest_id")
+    return progress
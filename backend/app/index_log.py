@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import os
+import struct
+import zlib
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+
+LogOp = Literal["upsert", "remove"]
+
+_MAGIC = b"FWAL"
+# magic, op code, vector count, dimension, crc32 of the payload
+_HEADER = struct.Struct("<4sBIII")
+_OP_CODES: dict[LogOp, int] = {"upsert": 1, "remove": 2}
+_OP_NAMES: dict[int, LogOp] = {code: name for name, code in _OP_CODES.items()}
+
+
+class IndexLog:
+    """Append-only log of mutations not yet checkpointed into a ``.faiss`` file.
+
+    Each entry is a fixed header followed by the int64 ids and, for upserts, the
+    float32 vectors (already normalized for cosine indexes). Replaying is
+    idempotent because an upsert always replaces the ids it carries.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def size(self) -> int:
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def append(
+        self, op: LogOp, ids: np.ndarray, vectors: np.ndarray | None = None
+    ) -> int:
+        """Durably append one entry; returns the number of bytes written."""
+        ids = np.ascontiguousarray(ids, dtype="<i8")
+        payload = ids.tobytes()
+        dimension = 0
+        if vectors is not None:
+            vectors = np.ascontiguousarray(vectors, dtype="<f4")
+            dimension = vectors.shape[1]
+            payload += vectors.tobytes()
+
+        header = _HEADER.pack(
+            _MAGIC, _OP_CODES[op], ids.size, dimension, zlib.crc32(payload)
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("ab") as handle:
+            handle.write(header + payload)
+            handle.flush()
+            os.fsync(handle.fileno())
+        return _HEADER.size + len(payload)
+
+    def entries(self) -> Iterator[tuple[LogOp, np.ndarray, np.ndarray | None]]:
+        """Yield logged mutations in order.
+
+        A torn or corrupt tail (e.g. from a crash mid-append) ends the replay and
+        is cut off so later appends start from a clean entry boundary.
+        """
+        if not self.path.exists():
+            return
+
+        with self.path.open("rb") as handle:
+            data = handle.read()
+
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            magic, code, count, dimension, checksum = _HEADER.unpack_from(data, offset)
+            start = offset + _HEADER.size
+            end = start + count * 8 + count * dimension * 4
+            if (
+                magic != _MAGIC
+                or code not in _OP_NAMES
+                or end > len(data)
+                or zlib.crc32(data[start:end]) != checksum
+            ):
+                break
+
+            ids = np.frombuffer(data, dtype="<i8", count=count, offset=start)
+            vectors = None
+            if dimension:
+                vectors = np.frombuffer(
+                    data, dtype="<f4", count=count * dimension, offset=start + count * 8
+                ).reshape(count, dimension)
+            yield _OP_NAMES[code], ids, vectors
+            offset = end
+
+        if offset < len(data):
+            with self.path.open("r+b") as handle:
+                handle.truncate(offset)
+
+    def truncate(self) -> None:
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,159 @@
+"""Prometheus metrics shared by the FAISS and Docling servers.
+
+Each server calls ``instrument(app, service)`` to record per-route request
+latency and expose ``/metrics``. When running several worker processes, point
+PROMETHEUS_MULTIPROC_DIR at an empty directory so ``/metrics`` aggregates the
+samples of every worker.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+from fastapi import FastAPI, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Requests range from sub-millisecond lookups to multi-minute document conversions.
+_LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    600.0,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending its last body chunk.",
+    ["service", "method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+# FAISS server
+INDEX_LOAD_SECONDS = Histogram(
+    "faiss_index_load_seconds",
+    "Time to load an index into the cache, including log replay.",
+    ["mode"],
+    buckets=_LATENCY_BUCKETS,
+)
+INDEX_SAVE_SECONDS = Histogram(
+    "faiss_index_save_seconds",
+    "Time to write one index (or shard) file.",
+    buckets=_LATENCY_BUCKETS,
+)
+INDEX_READ_BYTES = Counter(
+    "faiss_index_read_bytes",
+    "Bytes of index and log files loaded into the cache (mapped, for mmap loads).",
+    ["mode"],
+)
+INDEX_WRITTEN_BYTES = Counter(
+    "faiss_index_written_bytes",
+    "Bytes written to index files and their logs.",
+    ["kind"],
+)
+INDEX_CACHE_LOOKUPS = Counter(
+    "faiss_index_cache_lookups",
+    "Loaded-index cache lookups; hit ratio is hit / (hit + miss).",
+    ["result"],
+)
+UPSERT_VECTORS = Histogram(
+    "faiss_upsert_vectors",
+    "Vectors per upsert batch.",
+    buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000),
+)
+
+# Docling server
+DOCLING_CONVERSION_SECONDS = Histogram(
+    "docling_conversion_seconds",
+    "Wall time of one document conversion.",
+    buckets=_LATENCY_BUCKETS,
+)
+DOCLING_PAGES = Counter("docling_pages", "Pages converted.")
+DOCLING_PAGES_PER_SECOND = Histogram(
+    "docling_pages_per_second",
+    "Conversion throughput of one document.",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0),
+)
+DOCLING_CACHE_LOOKUPS = Counter(
+    "docling_parse_cache_lookups",
+    "Parse result cache lookups; hit ratio is hit / (hit + miss).",
+    ["result"],
+)
+VLM_REQUEST_SECONDS = Histogram(
+    "docling_vlm_request_seconds",
+    "Latency of one VLM API call (one page image).",
+    ["outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+
+class _RequestMetrics:
+    """ASGI middleware timing each request until its response body is complete.
+
+    Routes are labelled by their path template, so path parameters do not
+    create new series; requests that match no route share one label.
+    """
+
+    def __init__(self, app: ASGIApp, service: str) -> None:
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(
+                self.service, scope["method"], route, str(status)
+            ).observe(time.perf_counter() - started)
+
+
+def _render() -> bytes:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def instrument(app: FastAPI, service: str) -> None:
+    """Add request latency tracking and a ``/metrics`` endpoint to ``app``."""
+    app.add_middleware(_RequestMetrics, service=service)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics() -> Response:
+        return Response(_render(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+
+@dataclass
+class CachedParse:
+    markdown: str
+    # Markdown of each page, in page order.
+    pages: list[str]
+    # The DoclingDocument, as exported by ``export_to_dict``.
+    document: dict[str, Any]
+
+    @property
+    def num_pages(self) -> int:
+        return len(self.pages)
+
+
+class ParseCache:
+    """Parse results on disk, one JSON file per (file content, options) key.
+
+    Reading an entry bumps its mtime, and every write evicts the least recently
+    used entries until the directory fits in ``max_bytes``. A ``max_bytes`` of
+    0 disables the cache. Unreadable entries count as misses and are removed.
+    """
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(content: bytes, options: dict[str, Any]) -> str:
+        """SHA-256 of the file, then a digest of the options that shape the output."""
+        options_digest = hashlib.sha256(
+            json.dumps(options, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        return f"{hashlib.sha256(content).hexdigest()}-{options_digest[:16]}"
+
+    def get(self, key: str) -> CachedParse | None:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with path.open("r", encoding="utf-8") as handle:
+                data = json.load(handle)
+            cached = CachedParse(
+                markdown=data["markdown"],
+                pages=data["pages"],
+                document=data["document"],
+            )
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return cached
+
+    def put(self, key: str, parse: CachedParse) -> None:
+        if not self.enabled:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        try:
+            with tmp_path.open("w", encoding="utf-8") as handle:
+                json.dump(
+                    {
+                        "markdown": parse.markdown,
+                        "pages": parse.pages,
+                        "document": parse.document,
+                    },
+                    handle,
+                )
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self._evict()
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            for path in self.root.glob("*.json"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
@@ -0,0 +1,464 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+RecordRow = tuple[int, str, dict[str, Any]]
+# {key: value} for equality, or {key: {op: operand}} with op from FILTER_OPERATORS.
+MetadataFilter = dict[str, Any]
+
+FILTER_OPERATORS = frozenset({"eq", "in", "gt", "gte", "lt", "lte"})
+_RANGE_SQL = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    vector BLOB
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metadata_index (
+    key TEXT NOT NULL,
+    value_text TEXT,
+    value_num REAL,
+    id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS metadata_index_text ON metadata_index (key, value_text, id);
+CREATE INDEX IF NOT EXISTS metadata_index_num ON metadata_index (key, value_num, id);
+CREATE INDEX IF NOT EXISTS metadata_index_id ON metadata_index (id);
+CREATE TABLE IF NOT EXISTS tombstones (
+    id INTEGER PRIMARY KEY
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+    text, content='records', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+# Settings keys marking that metadata_index / records_fts cover every record.
+_METADATA_INDEX_READY = "_metadata_index_ready"
+_TEXT_INDEX_READY = "_text_index_ready"
+
+# SQLite caps the number of bound parameters per statement.
+_MAX_VARIABLES = 900
+
+
+def _index_terms(value: Any) -> list[tuple[str | None, float | None]]:
+    """(value_text, value_num) postings for one metadata value.
+
+    Strings and booleans are matched as text, numbers numerically, and lists
+    post each scalar element. Nested objects and nulls are not indexed.
+    """
+    if isinstance(value, bool):
+        return [("true" if value else "false", None)]
+    if isinstance(value, (int, float)):
+        return [(None, float(value))]
+    if isinstance(value, str):
+        return [(value, None)]
+    if isinstance(value, list):
+        return [
+            term
+            for element in value
+            if not isinstance(element, list)
+            for term in _index_terms(element)
+        ]
+    return []
+
+
+def _postings(
+    item_id: int, metadata: dict[str, Any]
+) -> list[tuple[str, str | None, float | None, int]]:
+    return [
+        (key, value_text, value_num, item_id)
+        for key, value in metadata.items()
+        for value_text, value_num in _index_terms(value)
+    ]
+
+
+def validate_filter(conditions: MetadataFilter) -> MetadataFilter:
+    """Check a metadata filter's shape; raises ValueError on bad operators."""
+    for key, condition in conditions.items():
+        if not isinstance(condition, dict):
+            continue
+        if not condition:
+            raise ValueError(f"Empty condition for {key!r}")
+        unknown = set(condition) - FILTER_OPERATORS
+        if unknown:
+            raise ValueError(f"Unknown filter operators for {key!r}: {sorted(unknown)}")
+        for op, operand in condition.items():
+            if op in _RANGE_SQL and (
+                isinstance(operand, bool) or not isinstance(operand, (int, float))
+            ):
+                raise ValueError(f"{key!r}.{op} needs a number")
+            if op == "in" and (not isinstance(operand, list) or not operand):
+                raise ValueError(f"{key!r}.in needs a non-empty list")
+            if op == "in" and len(operand) > _MAX_VARIABLES // 2:
+                raise ValueError(
+                    f"{key!r}.in accepts at most {_MAX_VARIABLES // 2} values"
+                )
+    return conditions
+
+
+def _match_expression(query: str) -> str | None:
+    """FTS5 query matching any whitespace-separated term of ``query``.
+
+    Every term is quoted, so FTS syntax in user input is taken literally and an
+    identifier such as ``INV-2024-017`` matches as one phrase.
+    """
+    terms = [term.replace('"', '""') for term in query.split()]
+    terms = [term for term in terms if any(char.isalnum() for char in term)]
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def _condition_sql(key: str, condition: Any) -> tuple[str, list[Any]]:
+    """SELECT of the ids matching one key's condition against metadata_index."""
+    if not isinstance(condition, dict):
+        condition = {"eq": condition}
+
+    clauses: list[str] = []
+    params: list[Any] = [key]
+    for op, operand in condition.items():
+        if op in _RANGE_SQL:
+            clauses.append(f"value_num {_RANGE_SQL[op]} ?")
+            params.append(float(operand))
+            continue
+        values = operand if op == "in" else [operand]
+        terms = [term for value in values for term in _index_terms(value)]
+        texts = [text for text, _ in terms if text is not None]
+        numbers = [number for _, number in terms if number is not None]
+        options = []
+        if texts:
+            options.append(f"value_text IN ({','.join('?' * len(texts))})")
+            params.extend(texts)
+        if numbers:
+            options.append(f"value_num IN ({','.join('?' * len(numbers))})")
+            params.extend(numbers)
+        clauses.append(f"({' OR '.join(options)})" if options else "0")
+
+    where = " AND ".join(clauses)
+    return f"SELECT id FROM metadata_index WHERE key = ? AND {where}", params
+
+
+def _filter_sql(conditions: MetadataFilter) -> tuple[str, list[Any]]:
+    """SELECT of the ids matching every condition, one INTERSECT term per key."""
+    queries = [_condition_sql(key, condition) for key, condition in conditions.items()]
+    if not queries:
+        raise ValueError("Empty metadata filter")
+    sql = " INTERSECT ".join(query for query, _ in queries)
+    return sql, [param for _, query_params in queries for param in query_params]
+
+
+class RecordStore:
+    """Text and metadata of the vectors in one FAISS index, kept in SQLite.
+
+    Records are keyed by vector id, so lookups and pages only touch the rows they
+    need. Every thread gets its own connection; with WAL journaling readers never
+    block each other or the single writer.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(records)")}
+            if "vector" not in columns:
+                conn.execute("ALTER TABLE records ADD COLUMN vector BLOB")
+        if not self.get_setting(_METADATA_INDEX_READY, False):
+            self._rebuild_metadata_index()
+        if not self.get_setting(_TEXT_INDEX_READY, False):
+            self._rebuild_text_index()
+
+    def _rebuild_metadata_index(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM metadata_index")
+            for item_id, _, metadata in self.iter_records():
+                conn.executemany(
+                    "INSERT INTO metadata_index (key, value_text, value_num, id) VALUES (?, ?, ?, ?)",
+                    _postings(item_id, metadata),
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                (_METADATA_INDEX_READY, json.dumps(True)),
+            )
+
+    def _rebuild_text_index(self) -> None:
+        with self._connect() as conn:
+            conn.execute("INSERT INTO records_fts (records_fts) VALUES ('rebuild')")
+            conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                (_TEXT_INDEX_READY, json.dumps(True)),
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_setting(self, key: str, default: Any = None) -> Any:
+        row = (
+            self._connect()
+            .execute("SELECT value FROM settings WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else default
+
+    def set_settings(self, **values: Any) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in values.items()],
+            )
+
+    def reset(self, **settings: Any) -> None:
+        """Drop every record and replace the settings in one transaction."""
+        settings[_METADATA_INDEX_READY] = True
+        settings[_TEXT_INDEX_READY] = True
+        with self._connect() as conn:
+            conn.execute("INSERT INTO records_fts (records_fts) VALUES ('delete-all')")
+            conn.execute("DELETE FROM records")
+            conn.execute("DELETE FROM metadata_index")
+            conn.execute("DELETE FROM tombstones")
+            conn.execute("DELETE FROM settings")
+            conn.executemany(
+                "INSERT INTO settings (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in settings.items()],
+            )
+
+    def upsert(
+        self, rows: Iterable[RecordRow], vectors: np.ndarray | None = None
+    ) -> None:
+        """Insert or replace records, optionally with their full-precision vectors.
+
+        ``vectors`` is aligned with ``rows`` and kept for exact re-ranking of
+        results from indexes with lossy compression.
+        """
+        rows = list(rows)
+        params = [
+            (item_id, text, json.dumps(metadata, ensure_ascii=False), None)
+            for item_id, text, metadata in rows
+        ]
+        if vectors is not None:
+            vectors = np.ascontiguousarray(vectors, dtype="<f4")
+            params = [
+                (*row[:3], vector.tobytes()) for row, vector in zip(params, vectors)
+            ]
+        ids = [row[0] for row in params]
+        postings = [
+            posting
+            for item_id, _, metadata in rows
+            for posting in _postings(item_id, metadata)
+        ]
+        with self._connect() as conn:
+            for start in range(0, len(ids), _MAX_VARIABLES):
+                chunk = ids[start : start + _MAX_VARIABLES]
+                self._unindex(conn, chunk)
+                conn.execute(
+                    f"DELETE FROM tombstones WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO records (id, text, metadata, vector) VALUES (?, ?, ?, ?)",
+                params,
+            )
+            conn.executemany(
+                "INSERT INTO records_fts (rowid, text) VALUES (?, ?)",
+                [(item_id, text) for item_id, text, _ in rows],
+            )
+            conn.executemany(
+                "INSERT INTO metadata_index (key, value_text, value_num, id) VALUES (?, ?, ?, ?)",
+                postings,
+            )
+
+    def delete(self, ids: Iterable[int], tombstone: bool = True) -> list[int]:
+        """Remove records and tombstone their ids until the index is compacted.
+
+        Pass ``tombstone=False`` for ids whose vectors are not in the index.
+        Returns the ids that actually had a record.
+        """
+        wanted = list(dict.fromkeys(int(item_id) for item_id in ids))
+        deleted: list[int] = []
+        with self._connect() as conn:
+            for start in range(0, len(wanted), _MAX_VARIABLES):
+                chunk = wanted[start : start + _MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                found = [
+                    row[0]
+                    for row in conn.execute(
+                        f"SELECT id FROM records WHERE id IN ({placeholders})", chunk
+                    )
+                ]
+                if not found:
+                    continue
+                self._unindex(conn, found)
+                placeholders = ",".join("?" * len(found))
+                conn.execute(f"DELETE FROM records WHERE id IN ({placeholders})", found)
+                if not tombstone:
+                    deleted.extend(found)
+                    continue
+                conn.executemany(
+                    "INSERT OR IGNORE INTO tombstones (id) VALUES (?)",
+                    [(item_id,) for item_id in found],
+                )
+                deleted.extend(found)
+        return deleted
+
+    def ids(self) -> np.ndarray:
+        cursor = self._connect().execute("SELECT id FROM records ORDER BY id")
+        return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+
+    def tombstones(self) -> np.ndarray:
+        """Ids deleted from the records whose vectors are still in the index."""
+        cursor = self._connect().execute("SELECT id FROM tombstones ORDER BY id")
+        return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+
+    def clear_tombstones(self, ids: Iterable[int]) -> None:
+        wanted = [int(item_id) for item_id in ids]
+        with self._connect() as conn:
+            for start in range(0, len(wanted), _MAX_VARIABLES):
+                chunk = wanted[start : start + _MAX_VARIABLES]
+                conn.execute(
+                    f"DELETE FROM tombstones WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+
+    @staticmethod
+    def _unindex(conn: sqlite3.Connection, ids: list[int]) -> None:
+        """Drop the metadata postings and full-text entries of existing records."""
+        placeholders = ",".join("?" * len(ids))
+        conn.execute(f"DELETE FROM metadata_index WHERE id IN ({placeholders})", ids)
+        # The external-content FTS table needs the old text to unindex a row.
+        conn.execute(
+            "INSERT INTO records_fts (records_fts, rowid, text) "
+            f"SELECT 'delete', id, text FROM records WHERE id IN ({placeholders})",
+            ids,
+        )
+
+    def get_many(self, ids: Iterable[int]) -> dict[int, tuple[str, dict[str, Any]]]:
+        conn = self._connect()
+        wanted = list(dict.fromkeys(int(item_id) for item_id in ids))
+        found: dict[int, tuple[str, dict[str, Any]]] = {}
+        for start in range(0, len(wanted), _MAX_VARIABLES):
+            chunk = wanted[start : start + _MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = conn.execute(
+                f"SELECT id, text, metadata FROM records WHERE id IN ({placeholders})",
+                chunk,
+            )
+            for item_id, text, metadata in cursor:
+                found[item_id] = (text, json.loads(metadata))
+        return found
+
+    def get_vectors(self, ids: Iterable[int]) -> dict[int, np.ndarray]:
+        conn = self._connect()
+        wanted = list(dict.fromkeys(int(item_id) for item_id in ids))
+        found: dict[int, np.ndarray] = {}
+        for start in range(0, len(wanted), _MAX_VARIABLES):
+            chunk = wanted[start : start + _MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = conn.execute(
+                f"SELECT id, vector FROM records WHERE vector IS NOT NULL AND id IN ({placeholders})",
+                chunk,
+            )
+            for item_id, vector in cursor:
+                found[item_id] = np.frombuffer(vector, dtype="<f4")
+        return found
+
+    def filter_ids(self, conditions: MetadataFilter) -> np.ndarray:
+        """Ids whose metadata satisfies every condition, from the inverted index."""
+        sql, params = _filter_sql(conditions)
+        cursor = self._connect().execute(sql, params)
+        return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+
+    def lexical_search(
+        self, query: str, limit: int, conditions: MetadataFilter | None = None
+    ) -> list[tuple[int, float]]:
+        """Best ``limit`` (id, score) matches for ``query`` by BM25, best first.
+
+        Scores are FTS5's bm25() negated so that higher is better.
+        """
+        expression = _match_expression(query)
+        if expression is None:
+            return []
+        sql = "SELECT rowid, -bm25(records_fts) FROM records_fts WHERE records_fts MATCH ?"
+        params: list[Any] = [expression]
+        if conditions:
+            filter_sql, filter_params = _filter_sql(conditions)
+            sql += f" AND rowid IN ({filter_sql})"
+            params.extend(filter_params)
+        sql += " ORDER BY bm25(records_fts) LIMIT ?"
+        params.append(limit)
+        return [
+            (item_id, score)
+            for item_id, score in self._connect().execute(sql, params).fetchall()
+        ]
+
+    def iter_records(self) -> Iterator[RecordRow]:
+        cursor = self._connect().execute(
+            "SELECT id, text, metadata FROM records ORDER BY id"
+        )
+        for item_id, text, metadata in cursor:
+            yield item_id, text, json.loads(metadata)
+
+    def page(
+        self, limit: int, offset: int = 0, after_id: int | None = None
+    ) -> list[RecordRow]:
+        """Records in id order, by offset or, cheaper, after a previous page's last id."""
+        conn = self._connect()
+        if after_id is not None:
+            cursor = conn.execute(
+                "SELECT id, text, metadata FROM records WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit),
+            )
+        else:
+            cursor = conn.execute(
+                "SELECT id, text, metadata FROM records ORDER BY id LIMIT ? OFFSET ?",
+                (limit, offset),
+            )
+        return [
+            (item_id, text, json.loads(metadata)) for item_id, text, metadata in cursor
+        ]
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+
+def migrate_meta_json(meta_file: Path, store: RecordStore) -> None:
+    """Import a legacy ``.meta.json`` file into ``store`` and retire it."""
+    data = json.loads(meta_file.read_text(encoding="utf-8"))
+    if not isinstance(data, dict):
+        raise ValueError("invalid meta format")
+
+    records = data.get("records")
+    rows: list[RecordRow] = []
+    if isinstance(records, dict):
+        for key, value in records.items():
+            try:
+                item_id = int(key)
+            except (TypeError, ValueError):
+                continue
+            if not isinstance(value, dict):
+                continue
+            rows.append((item_id, value.get("text", ""), value.get("metadata", {})))
+
+    store.upsert(rows)
+    store.set_settings(
+        dimension=data.get("dimension"),
+        metric=data.get("metric", "cosine"),
+    )
+    meta_file.rename(meta_file.with_name(meta_file.name + ".migrated"))
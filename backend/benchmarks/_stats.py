@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import statistics
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summary(samples: list[float], elapsed: float) -> dict[str, float]:
+    """Throughput and latency percentiles for per-operation durations in seconds."""
+    return {
+        "count": len(samples),
+        "throughput_per_s": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+    }
@@ -0,0 +1,235 @@
+"""End-to-end benchmark of the FAISS API on synthetic corpora.
+
+For every corpus size x dimension, a fresh index is created and filled through
+``/faiss/indexes/upsert`` in batches, then ``info``, paged ``content`` and
+``search`` are driven through the FastAPI app in-process. Each operation
+reports throughput and p50/p99 latency. Peak RSS comes from
+``resource.getrusage`` and is a running maximum, so it grows across corpora in
+one run. The report is JSON with the configuration and library versions, and
+a fixed seed makes runs comparable.
+
+Run from ``backend/``::
+
+    python -m benchmarks.faiss_api --sizes 1000,10000 --dims 128,384 --output bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+
+import faiss
+import numpy as np
+from fastapi.testclient import TestClient
+from httpx import Response
+
+from app.faiss_server import app
+
+from ._stats import summary
+
+# Server knobs recorded with every report, since they change the numbers.
+_SERVER_ENV = (
+    "FAISS_PERSIST_MODE",
+    "FAISS_WAL_CHECKPOINT_BYTES",
+    "FAISS_FLUSH_INTERVAL_MS",
+    "FAISS_FLUSH_MAX_MUTATIONS",
+    "FAISS_MMAP_READS",
+    "FAISS_CACHE_MAX_BYTES",
+    "FAISS_SHARD_SEARCH_THREADS",
+    "FAISS_SEARCH_BATCH_MAX",
+    "FAISS_SEARCH_BATCH_WAIT_MS",
+)
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+def _timed(
+    samples: list[float], call: Callable[[], Response], expect: int = 200
+) -> Response:
+    started = time.perf_counter()
+    response = call()
+    samples.append(time.perf_counter() - started)
+    if response.status_code != expect:
+        raise RuntimeError(f"{response.status_code}: {response.text[:500]}")
+    return response
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def run_corpus(
+    client: TestClient, args: argparse.Namespace, size: int, dim: int
+) -> dict[str, object]:
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+    picks = rng.integers(0, size, args.queries)
+    queries = vectors[picks] + rng.normal(0, 0.05, (args.queries, dim)).astype(
+        np.float32
+    )
+
+    base_dir = tempfile.mkdtemp(prefix="faiss-bench-")
+    samples: dict[str, list[float]] = {
+        name: [] for name in ("create", "upsert", "info", "content", "search")
+    }
+    elapsed: dict[str, float] = {}
+    try:
+        started = time.perf_counter()
+        create = {
+            "base_dir": base_dir,
+            "db_name": f"bench-{size}-{dim}",
+            "dimension": dim,
+            "metric": args.metric,
+            "index_type": args.index_type,
+            "storage": args.storage,
+            "shards": args.shards,
+        }
+        if args.index_type.startswith("ivf"):
+            # IVF trains on the first upsert batch; faiss wants ~39 points per list.
+            create["nlist"] = max(1, min(args.nlist, min(size, args.batch_size) // 39))
+        response = _timed(
+            samples["create"],
+            lambda: client.post("/faiss/indexes/create", json=create),
+        )
+        db_path = response.json()["db_path"]
+        elapsed["create"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for start in range(0, size, args.batch_size):
+            stop = min(start + args.batch_size, size)
+            items = [
+                {
+                    "id": item_id,
+                    "text": f"synthetic chunk {item_id}",
+                    "vector": vectors[item_id].tolist(),
+                    "metadata": {"doc": item_id % 100, "page": item_id % 20},
+                }
+                for item_id in range(start, stop)
+            ]
+            _timed(
+                samples["upsert"],
+                lambda: client.post(
+                    "/faiss/indexes/upsert", json={"db_path": db_path, "items": items}
+                ),
+            )
+        elapsed["upsert"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(args.info_calls):
+            _timed(
+                samples["info"],
+                lambda: client.get("/faiss/indexes/info", params={"db_path": db_path}),
+            )
+        elapsed["info"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        after_id = None
+        for _ in range(args.content_pages):
+            params = {"db_path": db_path, "limit": args.page_size}
+            if after_id is not None:
+                params["after_id"] = after_id
+            page = _timed(
+                samples["content"],
+                lambda: client.get("/faiss/indexes/content", params=params),
+            ).json()
+            after_id = page["next_after_id"]
+            if after_id is None:
+                break
+        elapsed["content"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for query in queries:
+            search = {"db_path": db_path, "vectors": [query.tolist()], "k": args.k}
+            _timed(
+                samples["search"],
+                lambda: client.post("/faiss/indexes/search", json=search),
+            )
+        elapsed["search"] = time.perf_counter() - started
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    operations = {
+        name: summary(op_samples, elapsed.get(name, 0.0))
+        for name, op_samples in samples.items()
+    }
+    operations["upsert"]["vectors_per_s"] = (
+        size / elapsed["upsert"] if elapsed.get("upsert") else 0.0
+    )
+    return {
+        "size": size,
+        "dimension": dim,
+        "operations": operations,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run(args: argparse.Namespace) -> dict[str, object]:
+    client = TestClient(app)
+    corpora = [
+        run_corpus(client, args, size, dim)
+        for size in _int_list(args.sizes)
+        for dim in _int_list(args.dims)
+    ]
+    return {
+        "config": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "faiss": faiss.__version__,
+            "numpy": np.__version__,
+            "server_env": {
+                name: os.environ[name] for name in _SERVER_ENV if name in os.environ
+            },
+        },
+        "corpora": corpora,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--dims", default="128,384")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--info-calls", type=int, default=100)
+    parser.add_argument("--content-pages", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--metric", choices=["cosine", "l2", "ip"], default="cosine")
+    parser.add_argument(
+        "--index-type", choices=["flat", "ivf_flat", "ivf_pq", "hnsw"], default="flat"
+    )
+    parser.add_argument(
+        "--storage", choices=["float32", "fp16", "sq8", "pq"], default="float32"
+    )
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
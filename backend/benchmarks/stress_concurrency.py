@@ -0,0 +1,153 @@
+"""Mixed read/write stress test for the FAISS API.
+
+Writer threads upsert disjoint id ranges into one index while reader threads
+search it and fetch its info. Afterwards every written id must be present in
+both the index and the record store; a lost update fails the run. Latency and
+throughput per operation are printed as JSON.
+
+Run from ``backend/``::
+
+    python -m benchmarks.stress_concurrency --writers 8 --readers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.faiss_server import app
+
+from ._stats import summary
+
+
+def run(args: argparse.Namespace) -> dict[str, object]:
+    client = TestClient(app)
+    base_dir = tempfile.mkdtemp(prefix="faiss-stress-")
+
+    response = client.post(
+        "/faiss/indexes/create",
+        json={"base_dir": base_dir, "db_name": "stress", "dimension": args.dim},
+    )
+    response.raise_for_status()
+    db_path = response.json()["db_path"]
+
+    per_writer = args.batches * args.batch_size
+    expected = args.writers * per_writer
+    latencies: dict[str, list[float]] = {"upsert": [], "search": [], "info": []}
+    latency_lock = threading.Lock()
+    writers_done = threading.Event()
+    errors: list[str] = []
+
+    def record(kind: str, started: float) -> None:
+        with latency_lock:
+            latencies[kind].append(time.perf_counter() - started)
+
+    def writer(worker: int) -> None:
+        rng = np.random.default_rng(args.seed + worker)
+        vectors = rng.random((per_writer, args.dim), dtype=np.float32)
+        first_id = worker * per_writer
+        for batch in range(args.batches):
+            start = batch * args.batch_size
+            items = [
+                {
+                    "id": first_id + start + offset,
+                    "text": f"writer {worker} item {start + offset}",
+                    "vector": vectors[start + offset].tolist(),
+                }
+                for offset in range(args.batch_size)
+            ]
+            started = time.perf_counter()
+            response = client.post(
+                "/faiss/indexes/upsert", json={"db_path": db_path, "items": items}
+            )
+            record("upsert", started)
+            if response.status_code != 200:
+                errors.append(f"upsert: {response.status_code} {response.text}")
+
+    def reader() -> None:
+        rng = np.random.default_rng()
+        query = rng.random((1, args.dim), dtype=np.float32).tolist()
+        while not writers_done.is_set():
+            started = time.perf_counter()
+            response = client.post(
+                "/faiss/indexes/search",
+                json={"db_path": db_path, "vectors": query, "k": args.k},
+            )
+            record("search", started)
+            if response.status_code != 200:
+                errors.append(f"search: {response.status_code} {response.text}")
+
+            started = time.perf_counter()
+            response = client.get("/faiss/indexes/info", params={"db_path": db_path})
+            record("info", started)
+            if response.status_code != 200:
+                errors.append(f"info: {response.status_code} {response.text}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.writers + args.readers) as pool:
+        readers = [pool.submit(reader) for _ in range(args.readers)]
+        writers = [pool.submit(writer, worker) for worker in range(args.writers)]
+        for future in writers:
+            future.result()
+        writers_done.set()
+        for future in readers:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    total = client.get("/faiss/indexes/info", params={"db_path": db_path}).json()[
+        "total"
+    ]
+    stored = 0
+    after_id = None
+    while True:
+        params = {"db_path": db_path, "limit": 500, "preview_dim": 1}
+        if after_id is not None:
+            params["after_id"] = after_id
+        page = client.get("/faiss/indexes/content", params=params).json()
+        stored += len(page["items"])
+        after_id = page["next_after_id"]
+        if after_id is None:
+            break
+
+    return {
+        "config": vars(args),
+        "db_path": db_path,
+        "elapsed_s": elapsed,
+        "expected_vectors": expected,
+        "index_total": total,
+        "stored_records": stored,
+        "lost_updates": expected - min(total, stored),
+        "errors": errors[:20],
+        "operations": {
+            kind: summary(samples, elapsed) for kind, samples in latencies.items()
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    ok = report["lost_updates"] == 0 and not report["errors"]
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())